@@ -0,0 +1,152 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Keeps the sprites draw_world renders, tiles and text alike, in a file
+# between runs, so a new game doesn't have to draw them all again.
+#
+# There's a file for each tile size. It's read in one go, and only used if
+# it was written for the same drawing code and pygame, and its contents hash
+# to what it says. Otherwise it's ignored and the sprites are drawn as they
+# are needed, and written out again at exit.
+
+import os
+import sys
+import struct
+import pickle
+import hashlib
+
+import pygame
+from pygame.locals import SRCALPHA
+
+MAGIC = b'CHRYSPRT'
+# changes when the file layout does
+FORMAT_VERSION = 1
+# magic, format version, version digest, contents digest
+HEADER = struct.Struct('<8sI20s20s')
+
+# pickle protocol both python versions can read
+PICKLE_PROTOCOL = 2
+
+def get_cache_dir():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'chary')
+
+def get_cache_path(tile_width, tile_height):
+    return os.path.join(get_cache_dir(), 'sprites-%sx%s.cache' % (tile_width, tile_height))
+
+# identifies what drew the sprites: the files with the drawing code in them,
+# and the pygame that rendered the text
+def get_version_digest(source_paths):
+    digest = hashlib.sha1()
+    digest.update(('%s %s %s\n' % (FORMAT_VERSION, pygame.version.ver, sys.version_info[0])).encode('utf-8'))
+    for path in source_paths:
+        f = open(path, 'rb')
+        try:
+            digest.update(f.read())
+        finally:
+            f.close()
+    return digest.digest()
+
+def surface_to_entry(key, surface):
+    if surface.get_flags() & SRCALPHA:
+        mode = 'RGBA'
+    else:
+        mode = 'RGB'
+    return (key, surface.get_size(), mode, pygame.image.tostring(surface, mode))
+
+def entry_to_surface(size, mode, data):
+    surface = pygame.image.fromstring(data, size, mode)
+    # sprites made while the game runs have the screen's format, which is
+    # what makes them quick to blit
+    if pygame.display.get_surface() is not None:
+        if mode == 'RGBA':
+            surface = surface.convert_alpha()
+        else:
+            surface = surface.convert()
+    return surface
+
+class AssetCache(object):
+    def __init__(self, path, sprites, source_paths):
+        self.path = path
+        # the dictionary of sprites to fill in and save
+        self.sprites = sprites
+        self.version = get_version_digest(source_paths)
+        self.loaded = 0
+        # why the file wasn't used, if it wasn't
+        self.rejected = None
+
+    # adds the saved sprites to the dictionary, returning how many there were
+    def load(self):
+        try:
+            f = open(self.path, 'rb')
+        except (IOError, OSError):
+            self.rejected = 'missing'
+            return 0
+        try:
+            data = f.read()
+        finally:
+            f.close()
+
+        if len(data) < HEADER.size:
+            self.rejected = 'truncated'
+            return 0
+        magic, format_version, version, contents_digest = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION or version != self.version:
+            self.rejected = 'stale'
+            return 0
+        contents = data[HEADER.size:]
+        if hashlib.sha1(contents).digest() != contents_digest:
+            self.rejected = 'corrupt'
+            return 0
+
+        for key, size, mode, pixels in pickle.loads(contents):
+            if key not in self.sprites:
+                self.sprites[key] = entry_to_surface(size, mode, pixels)
+        self.loaded = len(self.sprites)
+        return self.loaded
+
+    # writes the sprites out, if there are any the file didn't have
+    def save(self):
+        if len(self.sprites) <= self.loaded:
+            return False
+
+        entries = [surface_to_entry(key, surface) for key, surface in self.sprites.items()]
+        contents = pickle.dumps(entries, PICKLE_PROTOCOL)
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, self.version, hashlib.sha1(contents).digest())
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # written next to the file and moved over it, so a game starting
+        # at the same time never reads half of it
+        temp_path = '%s.%s.tmp' % (self.path, os.getpid())
+        f = open(temp_path, 'wb')
+        try:
+            f.write(header)
+            f.write(contents)
+        finally:
+            f.close()
+        if hasattr(os, 'replace'):
+            os.replace(temp_path, self.path)
+        else:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(temp_path, self.path)
+        self.loaded = len(self.sprites)
+        return True
@@ -0,0 +1,539 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Sends a game's ticks to any number of viewer processes on the same machine.
+#
+# Each tick is encoded as what changed since the last one: cells, moves,
+# states, spawned objects, and the tick's destroyed objects and shots.
+# Objects are sent once, when they first show up, and are referred to by
+# number after that. Every so often a keyframe with the whole world is sent
+# instead, so viewers can start partway through a game.
+#
+# Messages go into a ring buffer in a memory mapped file. The game writes
+# each message once and never waits for viewers, so watching costs it the
+# same with one viewer or a hundred. Viewers that fall a lap behind lose
+# their place and start again from the newest keyframe.
+
+import mmap
+import time
+import struct
+import pickle
+import random
+import argparse
+
+from simulation import *
+
+# ring buffer layout: a header, then the messages
+MAGIC = b'CHRB'
+FORMAT_VERSION = 1
+# magic, format version, data size, lock, bytes written, messages written,
+# position and number of the newest keyframe
+HEADER = struct.Struct('<4sIQQQQQQ')
+HEADER_SIZE = 64
+LOCK_OFFSET = 16
+# message number, kind, payload length
+FRAME = struct.Struct('<QBI')
+
+KIND_KEYFRAME = 1
+KIND_DELTA = 2
+# a delta for a world changed in place by a click, in the same tick
+KIND_EDIT = 4
+# the rest of the ring is unused, and the next message is at the start
+KIND_WRAP = 3
+
+DEFAULT_CAPACITY = 4 * 1024 * 1024
+
+# messages between keyframes
+KEYFRAME_INTERVAL = 64
+
+# pickle protocol both python versions can read
+PICKLE_PROTOCOL = 2
+
+# world fields sent as they are, rather than by object number
+OBJECT_FIELDS = ('objects', 'cell_keys', 'grid_hash', 'dirty_cells', 'object_to_pos', 'object_state',
+                 'destroyed_objects', 'shot_animations', 'next_turret')
+
+def get_fields(world):
+    return dict((name, value) for name, value in world.__dict__.items() if name not in OBJECT_FIELDS)
+
+# the objects a world refers to, which a viewer needs numbers for
+def get_referenced(world):
+    result = set(obj for obj in world.objects if obj is not None)
+    result.update(world.object_to_pos)
+    for obj, destroyer in world.destroyed_objects.items():
+        result.add(obj)
+        result.add(destroyer)
+    for source, target in world.shot_animations:
+        result.add(source)
+        result.add(target)
+    result.add(world.next_turret)
+    result.discard(None)
+    return result
+
+# turns worlds into keyframes and deltas
+class WorldEncoder(object):
+    def __init__(self):
+        # object -> number, for objects the viewers have been sent
+        self.ids = {}
+        self.next_id = 1
+        # a copy of the last world encoded; the game changes worlds in place
+        # when it's clicked, so the world itself can't be compared against
+        self.last = None
+
+    def get_id(self, obj, new_objects):
+        if obj is None:
+            return 0
+        result = self.ids.get(obj)
+        if result is None:
+            result = self.ids[obj] = self.next_id
+            self.next_id += 1
+            new_objects.append((result, obj))
+        return result
+
+    def encode(self, world, keyframe=False):
+        last = self.last
+        if last is None or last.width != world.width or last.height != world.height:
+            # numbers aren't reused, so viewers can keep the objects they
+            # have across keyframes
+            keyframe = True
+            self.ids = {}
+        if keyframe:
+            last = None
+
+        get_id = self.get_id
+        new_objects = []
+
+        if last is None:
+            fields = get_fields(world)
+            cells = [(index, get_id(obj, new_objects)) for index, obj in enumerate(world.objects) if obj is not None]
+            positions = [(get_id(obj, new_objects), pos) for obj, pos in world.object_to_pos.items()]
+            states = [(get_id(obj, new_objects), state) for obj, state in world.object_state.items()]
+            removed = []
+        else:
+            fields = dict((name, value) for name, value in get_fields(world).items()
+                          if name not in last.__dict__ or last.__dict__[name] != value)
+            last_objects = last.objects
+            cells = [(index, get_id(obj, new_objects)) for index, obj in enumerate(world.objects)
+                     if obj is not last_objects[index]]
+            last_positions = last.object_to_pos
+            positions = [(get_id(obj, new_objects), pos) for obj, pos in world.object_to_pos.items()
+                         if last_positions.get(obj) != pos]
+            last_states = last.object_state
+            states = [(get_id(obj, new_objects), state) for obj, state in world.object_state.items()
+                      if obj not in last_states or last_states[obj] != state]
+            removed = [self.ids[obj] for obj in last_positions if obj not in world.object_to_pos]
+
+        # these only last a tick, so they're sent whole
+        destroyed = [(get_id(obj, new_objects), get_id(destroyer, new_objects))
+                     for obj, destroyer in world.destroyed_objects.items()]
+        shots = [(get_id(source, new_objects), get_id(target, new_objects))
+                 for source, target in world.shot_animations]
+        next_turret = get_id(world.next_turret, new_objects)
+
+        # numbers of objects nothing refers to anymore, so both sides can
+        # let go of them
+        referenced = get_referenced(world)
+        forgotten = [number for obj, number in self.ids.items() if obj not in referenced]
+        if forgotten:
+            self.ids = dict((obj, number) for obj, number in self.ids.items() if obj in referenced)
+
+        # a keyframe has every object, for viewers starting from it
+        if keyframe:
+            new_objects = [(self.ids[obj], obj) for obj in referenced]
+
+        self.last = world.copy()
+
+        payload = pickle.dumps((world.width, world.height, fields, new_objects, cells, positions, states,
+                                removed, destroyed, shots, next_turret, forgotten), PICKLE_PROTOCOL)
+        return (KIND_KEYFRAME if keyframe else KIND_DELTA), payload
+
+# turns keyframes and deltas back into worlds
+class WorldDecoder(object):
+    def __init__(self):
+        # number -> object
+        self.objects = {}
+        self.world = None
+
+    # returns the new world, leaving the last one as it was
+    def decode(self, kind, payload):
+        (width, height, fields, new_objects, cells, positions, states,
+         removed, destroyed, shots, next_turret, forgotten) = pickle.loads(payload)
+
+        if kind == KIND_KEYFRAME:
+            # viewers already following keep their objects, so they can be
+            # matched up with the last world's
+            self.objects = dict((number, self.objects.get(number, obj)) for number, obj in new_objects)
+            new_objects = []
+            world = World.__new__(World)
+            world.width = width
+            world.height = height
+            world.objects = [None] * (width * height)
+            world.cell_keys = [0] * (width * height)
+            world.grid_hash = 0
+            world.dirty_cells = []
+            world.object_to_pos = {}
+            world.object_state = {}
+        elif self.world is None:
+            raise ValueError("a delta needs a keyframe before it")
+        else:
+            world = self.world.copy()
+
+        objects = self.objects
+        for number, obj in new_objects:
+            objects[number] = obj
+        objects[0] = None
+
+        world.__dict__.update(fields)
+        for index, number in cells:
+            world.objects[index] = objects[number]
+            world.dirty_cells.append(index)
+        for number, pos in positions:
+            world.object_to_pos[objects[number]] = pos
+        for number, state in states:
+            world.object_state[objects[number]] = state
+        for number in removed:
+            obj = objects[number]
+            del world.object_to_pos[obj]
+            world.object_state.pop(obj, None)
+        world.destroyed_objects = dict((objects[number], objects[destroyer]) for number, destroyer in destroyed)
+        world.shot_animations = [(objects[source], objects[target]) for source, target in shots]
+        world.next_turret = objects[next_turret]
+
+        # states and destructions change cells' hash keys too
+        for obj in world.object_to_pos:
+            x, y = world.object_to_pos[obj]
+            world.dirty_cells.append(x + y * width)
+
+        for number in forgotten:
+            objects.pop(number, None)
+
+        self.world = world
+        return world
+
+class RingHeader(object):
+    def __init__(self, capacity, lock, written, count, keyframe_position, keyframe_count):
+        self.capacity = capacity
+        self.lock = lock
+        self.written = written
+        self.count = count
+        self.keyframe_position = keyframe_position
+        self.keyframe_count = keyframe_count
+
+# writes messages to the ring; there can only be one writer
+class RingWriter(object):
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.file = open(path, 'w+b')
+        self.file.truncate(HEADER_SIZE + capacity)
+        self.map = mmap.mmap(self.file.fileno(), HEADER_SIZE + capacity)
+        self.lock = 0
+        self.written = 0
+        self.count = 0
+        # no keyframe yet
+        self.keyframe_position = 0
+        self.keyframe_count = 0
+        self.write_header()
+
+    def write_header(self):
+        HEADER.pack_into(self.map, 0, MAGIC, FORMAT_VERSION, self.capacity, self.lock, self.written,
+                         self.count, self.keyframe_position, self.keyframe_count)
+
+    def write(self, kind, payload):
+        capacity = self.capacity
+        size = FRAME.size + len(payload)
+        # readers trust what they copied only if the writer can't have got
+        # to it since, which needs messages to be small next to the ring
+        if size > capacity // 4:
+            raise ValueError("message of %s bytes is too big for a ring of %s" % (size, capacity))
+
+        position = self.written
+        offset = position % capacity
+        if capacity - offset < size:
+            if capacity - offset >= FRAME.size:
+                FRAME.pack_into(self.map, HEADER_SIZE + offset, self.count, KIND_WRAP, 0)
+            position += capacity - offset
+            offset = 0
+
+        start = HEADER_SIZE + offset
+        FRAME.pack_into(self.map, start, self.count, kind, len(payload))
+        self.map[start + FRAME.size:start + size] = payload
+
+        # an odd lock means the header is being changed
+        self.lock += 1
+        struct.pack_into('<Q', self.map, LOCK_OFFSET, self.lock)
+        self.written = position + size
+        if kind == KIND_KEYFRAME:
+            self.keyframe_position = position
+            self.keyframe_count = self.count
+        self.count += 1
+        self.lock += 1
+        self.write_header()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+# reads messages from the ring, however far behind the writer it is
+class RingReader(object):
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from('<4sI', self.map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("%s is not a tick broadcast" % path)
+        header = self.read_header()
+        self.capacity = header.capacity
+        # where the next message is, and its number; None until a keyframe
+        # has been found
+        self.position = None
+        self.count = None
+        # times the reader fell behind and started again from a keyframe
+        self.resyncs = 0
+
+    def read_header(self):
+        while True:
+            magic, version, capacity, lock, written, count, keyframe_position, keyframe_count = HEADER.unpack_from(self.map, 0)
+            if lock % 2 == 0:
+                header = RingHeader(capacity, lock, written, count, keyframe_position, keyframe_count)
+                if struct.unpack_from('<Q', self.map, LOCK_OFFSET)[0] == lock:
+                    return header
+            time.sleep(0)
+
+    # whether a message at position may have been written over by now
+    def overrun(self, position, header):
+        # the writer can be partway through a message and a wrap past what
+        # the header says, each at most a quarter of the ring
+        return header.written - position > self.capacity // 2
+
+    # returns the new messages as (kind, payload) pairs, starting from a
+    # keyframe if this is the first call or the reader fell behind
+    def poll(self):
+        header = self.read_header()
+        if self.position is not None and self.overrun(self.position, header):
+            self.position = None
+            self.resyncs += 1
+        if self.position is None:
+            if header.count == 0 or self.overrun(header.keyframe_position, header):
+                return []
+            self.position = header.keyframe_position
+            self.count = header.keyframe_count
+
+        capacity = self.capacity
+        position = self.position
+        count = self.count
+        messages = []
+        while count < header.count and position - self.position <= capacity:
+            offset = position % capacity
+            if capacity - offset < FRAME.size:
+                position += capacity - offset
+                continue
+            start = HEADER_SIZE + offset
+            number, kind, length = FRAME.unpack_from(self.map, start)
+            if number != count:
+                break
+            if kind == KIND_WRAP:
+                position += capacity - offset
+                continue
+            messages.append((kind, self.map[start + FRAME.size:start + FRAME.size + length]))
+            position += FRAME.size + length
+            count += 1
+
+        # anything copied after the writer came back around to it is garbage
+        if count < header.count or self.overrun(self.position, self.read_header()):
+            self.position = None
+            self.resyncs += 1
+            return []
+
+        self.position = position
+        self.count = count
+        return messages
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+# what the game uses to broadcast its worlds
+class TickPublisher(object):
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, keyframe_interval=KEYFRAME_INTERVAL):
+        self.writer = RingWriter(path, capacity)
+        self.encoder = WorldEncoder()
+        self.keyframe_interval = keyframe_interval
+        self.source = None
+        self.source_changes = None
+        self.published = 0
+
+    # sends world, unless it was the last world sent and hasn't been clicked
+    # since
+    def publish(self, world):
+        if world is self.source:
+            if world.changes == self.source_changes:
+                return
+            self.source_changes = world.changes
+            kind, payload = self.encoder.encode(world)
+            self.writer.write(KIND_EDIT, payload)
+            return
+        self.source = world
+        self.source_changes = world.changes
+        kind, payload = self.encoder.encode(world, self.published % self.keyframe_interval == 0)
+        self.writer.write(kind, payload)
+        self.published += 1
+
+    def close(self):
+        self.writer.close()
+
+# what a viewer uses to follow the game
+class TickSubscriber(object):
+    def __init__(self, path):
+        self.reader = RingReader(path)
+        self.decoder = None
+        self.old_world = None
+        self.world = None
+        # when the last two worlds arrived, to interpolate between them
+        self.received = None
+        self.interval = 0.3
+
+    # returns whether there's a new world
+    def poll(self):
+        resyncs = self.reader.resyncs
+        messages = self.reader.poll()
+        if not messages:
+            return False
+        if self.reader.resyncs != resyncs or self.decoder is None:
+            self.decoder = WorldDecoder()
+            self.world = None
+
+        ticked = False
+        for kind, payload in messages:
+            world = self.decoder.decode(kind, payload)
+            if self.world is None or (self.world.width, self.world.height) != (world.width, world.height):
+                self.old_world = world
+                ticked = True
+            elif kind != KIND_EDIT:
+                self.old_world = self.world
+                ticked = True
+            # an edit replaces the newest world, and the tick carries on
+            # from where it was
+            self.world = world
+
+        if ticked:
+            now = time.time()
+            if self.received is not None:
+                # smoothed, so one late tick doesn't make the next one jump
+                self.interval = self.interval * 0.75 + min(now - self.received, 2.0) * 0.25
+            self.received = now
+        return True
+
+    # how far between the last two worlds to draw
+    def get_t(self):
+        if self.received is None:
+            return 1.0
+        return min(1.0, (time.time() - self.received) / max(self.interval, 0.001))
+
+    def close(self):
+        self.reader.close()
+
+def publish(args):
+    from headless import presets, policies, wants_placement
+
+    random.seed(args.seed)
+    policy = policies[args.policy]()
+    publisher = TickPublisher(args.path, args.capacity)
+    try:
+        world = presets[args.preset](args.width, args.height)
+        next_tick = time.time()
+        while True:
+            if world.lost:
+                world = presets[args.preset](args.width, args.height)
+            elif wants_placement(world):
+                cell = policy.choose(world)
+                if cell is not None:
+                    world.clicked(cell[0], cell[1])
+            world = world.advance()
+            publisher.publish(world)
+
+            if args.tick_rate:
+                next_tick += 1.0 / args.tick_rate
+                delay = next_tick - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.time()
+    finally:
+        publisher.close()
+
+def view(args):
+    import pygame
+    from pygame.locals import QUIT, KEYDOWN, K_ESCAPE, Color
+    from tower import draw_world, draw_text
+
+    subscriber = TickSubscriber(args.path)
+    pygame.init()
+    screen = None
+    clock = pygame.time.Clock()
+    try:
+        while True:
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    return
+                elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                    return
+
+            subscriber.poll()
+            world = subscriber.world
+            if world is not None:
+                w = args.cell_size * world.width
+                h = args.cell_size * world.height
+                if screen is None or screen.get_size() != (w, h):
+                    screen = pygame.display.set_mode((w, h))
+                    pygame.display.set_caption("Chary - watching %s" % args.path)
+                screen.fill(Color(0,0,32,255))
+                draw_world(subscriber.old_world, world, subscriber.get_t(), screen, 0, 0, w, h)
+                if world.game_ui:
+                    draw_text(screen, str(world.score), 0, 0, 48)
+                pygame.display.flip()
+
+            clock.tick(60)
+    finally:
+        subscriber.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast a bot-played game's ticks, or watch a broadcast.")
+    subparsers = parser.add_subparsers(dest="command")
+    parser_publish = subparsers.add_parser("publish", help="play a game and broadcast it")
+    parser_publish.add_argument("path")
+    parser_publish.add_argument("--width", type=int, default=6)
+    parser_publish.add_argument("--height", type=int, default=8)
+    parser_publish.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY, help="size of the ring buffer in bytes")
+    parser_publish.add_argument("--tick-rate", type=float, default=3.0, help="ticks per second, 0 for unlimited")
+    parser_publish.add_argument("--preset", default="normal")
+    parser_publish.add_argument("--policy", default="coverage")
+    parser_publish.add_argument("--seed", type=int, default=0)
+    parser_view = subparsers.add_parser("view", help="watch a broadcast")
+    parser_view.add_argument("path")
+    parser_view.add_argument("--cell-size", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        publish(args)
+    elif args.command == "view":
+        view(args)
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
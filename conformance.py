@@ -0,0 +1,293 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs two simulation engines side by side on seeded random games and checks
+# that they produce the same worlds, tick for tick.
+#
+# An engine is a function taking (world, shoot) and returning the next world,
+# like World.advance. Engines are named in the engines dict, or given as
+# module:function.
+
+import sys
+import copy
+import time
+import random
+import argparse
+import importlib
+
+from simulation import *
+
+def reference_advance(world, shoot=True):
+    return World.advance_uncached(world, shoot, masked_combat=False)
+
+def masked_advance(world, shoot=True):
+    return World.advance_uncached(world, shoot, masked_combat=True)
+
+transposition_cache = TranspositionCache()
+
+def cached_advance(world, shoot=True):
+    return World.advance(world, shoot, transposition_cache)
+
+engines = {
+    'reference': reference_advance,
+    'cached': cached_advance,
+    'masked': masked_advance,
+}
+
+presets = {
+    'easy': make_easy_game,
+    'normal': make_normal_game,
+    'hard': make_hard_game,
+    'insane': make_insane_game,
+    'title': make_title_world,
+    'help1': make_help_world1,
+    'help2': make_help_world2,
+    'help4': make_help_world4,
+}
+
+# smallest boards the fixed layouts fit on
+preset_min_sizes = {
+    'title': (6, 8),
+    'help1': (6, 8),
+    'help2': (6, 8),
+    'help4': (6, 8),
+}
+
+CLICK_TURRET = "turret"
+CLICK_BADDIE = "baddie"
+
+def get_engine(name):
+    if name in engines:
+        return engines[name]
+    module_name, function_name = name.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+def object_signature(obj, world):
+    if obj is None:
+        return None
+    attrs = []
+    for key, value in sorted(vars(obj).items()):
+        if callable(value):
+            value = value.__name__
+        attrs.append((key, value))
+    return (type(obj).__name__, tuple(attrs), world.get_state(obj), world.is_destroyed(obj))
+
+def world_signature(world):
+    cells = tuple(object_signature(obj, world) for obj in world.objects)
+
+    destroyers = []
+    for obj, destroyer in world.destroyed_objects.items():
+        destroyers.append((world.get_location(obj), world.get_location(destroyer)))
+    destroyers.sort()
+
+    shots = tuple((world.get_location(source), world.get_location(target))
+        for source, target in world.shot_animations)
+
+    waves = tuple((count, enemy_type.__name__, state, spawnx)
+        for count, enemy_type, state, spawnx in world.waves)
+
+    return (cells, tuple(destroyers), shots, waves, world.lost, world.score,
+        world.num_waves, world.place_turret_cooldown, world.place_turret_points,
+        object_signature(world.next_turret, world), world.mouse_pos)
+
+def describe_difference(a, b, width):
+    names = ('cells', 'destroyed', 'shots', 'waves', 'lost', 'score',
+        'num_waves', 'place_turret_cooldown', 'place_turret_points',
+        'next_turret', 'mouse_pos')
+    lines = []
+    for name, value_a, value_b in zip(names, a, b):
+        if value_a == value_b:
+            continue
+        if name == 'cells':
+            for i, (cell_a, cell_b) in enumerate(zip(value_a, value_b)):
+                if cell_a != cell_b:
+                    lines.append("  cell %s,%s: %r != %r" % (i % width, i // width, cell_a, cell_b))
+        else:
+            lines.append("  %s: %r != %r" % (name, value_a, value_b))
+    return '\n'.join(lines)
+
+class Scenario(object):
+    def __init__(self, seed, preset, width, height, ticks, clicks):
+        self.seed = seed
+        self.preset = preset
+        self.width = width
+        self.height = height
+        self.ticks = ticks
+        # (tick, x, y, kind), sorted by tick
+        self.clicks = clicks
+
+    def replace(self, ticks=None, clicks=None):
+        if ticks is None:
+            ticks = self.ticks
+        if clicks is None:
+            clicks = self.clicks
+        return Scenario(self.seed, self.preset, self.width, self.height, ticks,
+            [click for click in clicks if click[0] < ticks])
+
+    def __repr__(self):
+        return "Scenario(seed=%r, preset=%r, width=%r, height=%r, ticks=%r, clicks=%r)" % (
+            self.seed, self.preset, self.width, self.height, self.ticks, self.clicks)
+
+def random_scenario(rng, ticks, max_width=16, max_height=16, click_rate=0.2):
+    preset = rng.choice(sorted(presets))
+    min_width, min_height = preset_min_sizes.get(preset, (1, 2))
+    width = rng.randint(min_width, max(min_width, max_width))
+    height = rng.randint(min_height, max(min_height, max_height))
+    clicks = []
+    for tick in range(ticks):
+        if rng.random() < click_rate:
+            if rng.random() < 0.25:
+                kind = CLICK_BADDIE
+            else:
+                kind = CLICK_TURRET
+            clicks.append((tick, rng.randrange(width), rng.randrange(height), kind))
+    return Scenario(rng.getrandbits(32), preset, width, height, ticks, clicks)
+
+def apply_click(world, x, y, kind):
+    world.hover(x, y)
+    if kind == CLICK_BADDIE:
+        click_to_baddie = world.click_to_baddie
+        world.click_to_baddie = True
+        world.clicked(x, y)
+        world.click_to_baddie = click_to_baddie
+    else:
+        world.clicked(x, y)
+
+class Result(object):
+    def __init__(self):
+        self.divergence_tick = None
+        self.difference = ""
+        self.ticks = 0
+        self.times = [0.0, 0.0]
+
+def run_scenario(scenario, engine_a, engine_b):
+    result = Result()
+
+    random.seed(scenario.seed)
+    world_a = presets[scenario.preset](scenario.width, scenario.height)
+    world_b = copy.deepcopy(world_a)
+
+    clicks = scenario.clicks
+    click_index = 0
+
+    for tick in range(scenario.ticks):
+        while click_index < len(clicks) and clicks[click_index][0] == tick:
+            click_tick, x, y, kind = clicks[click_index]
+            state = random.getstate()
+            apply_click(world_a, x, y, kind)
+            random.setstate(state)
+            apply_click(world_b, x, y, kind)
+            click_index += 1
+
+        state = random.getstate()
+        start = time.time()
+        world_a = engine_a(world_a, True)
+        result.times[0] += time.time() - start
+        state_a = random.getstate()
+
+        random.setstate(state)
+        start = time.time()
+        world_b = engine_b(world_b, True)
+        result.times[1] += time.time() - start
+
+        result.ticks += 1
+
+        signature_a = world_signature(world_a)
+        signature_b = world_signature(world_b)
+        if signature_a != signature_b or state_a != random.getstate() or world_a.state_hash() != world_b.state_hash():
+            result.divergence_tick = tick
+            if signature_a != signature_b:
+                result.difference = describe_difference(signature_a, signature_b, world_a.width)
+            elif state_a != random.getstate():
+                result.difference = "  random number generator state differs"
+            else:
+                result.difference = "  state hash differs: %x != %x" % (world_a.state_hash(), world_b.state_hash())
+            break
+
+    return result
+
+def shrink(scenario, engine_a, engine_b):
+    def fails(candidate):
+        return run_scenario(candidate, engine_a, engine_b).divergence_tick is not None
+
+    scenario = scenario.replace(ticks=run_scenario(scenario, engine_a, engine_b).divergence_tick + 1)
+
+    # drop clicks, in halves and then one at a time
+    chunk = max(1, len(scenario.clicks) // 2)
+    while scenario.clicks:
+        i = 0
+        removed = False
+        while i < len(scenario.clicks):
+            candidate = scenario.replace(clicks=scenario.clicks[:i] + scenario.clicks[i+chunk:])
+            if fails(candidate):
+                scenario = candidate
+                removed = True
+            else:
+                i += chunk
+        if chunk == 1 and not removed:
+            break
+        chunk = max(1, chunk // 2)
+
+    # a shorter game may diverge earlier once clicks are gone
+    scenario = scenario.replace(ticks=run_scenario(scenario, engine_a, engine_b).divergence_tick + 1)
+
+    return scenario
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a simulation engine against the reference engine.")
+    parser.add_argument("engine", help="engine to test: a name from conformance.engines or module:function")
+    parser.add_argument("--reference", default="reference")
+    parser.add_argument("--ticks", type=int, default=1000000, help="total ticks to simulate")
+    parser.add_argument("--game-ticks", type=int, default=500, help="ticks per random game")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--max-width", type=int, default=16)
+    parser.add_argument("--max-height", type=int, default=16)
+    args = parser.parse_args()
+
+    engine_a = get_engine(args.reference)
+    engine_b = get_engine(args.engine)
+
+    rng = random.Random(args.seed)
+
+    ticks = 0
+    games = 0
+    times = [0.0, 0.0]
+    while ticks < args.ticks:
+        scenario = random_scenario(rng, min(args.game_ticks, args.ticks - ticks),
+            args.max_width, args.max_height)
+        result = run_scenario(scenario, engine_a, engine_b)
+
+        ticks += result.ticks
+        games += 1
+        times[0] += result.times[0]
+        times[1] += result.times[1]
+
+        if result.divergence_tick is not None:
+            sys.stdout.write("divergence after %s ticks, shrinking...\n" % ticks)
+            scenario = shrink(scenario, engine_a, engine_b)
+            result = run_scenario(scenario, engine_a, engine_b)
+            sys.stdout.write("minimal reproducer: %r\n" % scenario)
+            sys.stdout.write("diverges at tick %s:\n%s\n" % (result.divergence_tick, result.difference))
+            return 1
+
+    sys.stdout.write("%s games, %s ticks, no divergence\n" % (games, ticks))
+    sys.stdout.write("%s: %.3fs, %s: %.3fs" % (args.reference, times[0], args.engine, times[1]))
+    if times[1] > 0:
+        sys.stdout.write(" (%.2fx speed)" % (times[0] / times[1]))
+    sys.stdout.write("\n")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# A reset/step environment running many games in worker processes, for
+# training and evaluating turret placement agents.
+#
+# Each step is one placement decision: the action is a cell index
+# (x + y * width) to place next_turret on, or width * height to not place
+# one, and the games then advance until a turret can be placed again. The
+# reward is the score gained. Finished games are reset right away, so the
+# observations after a done are of a new game.
+#
+# Observations, rewards and flags are written by the workers into shared
+# memory, so only the actions and a few bytes of commands are pickled per
+# step. They are numpy arrays when numpy is available, and flat ctypes arrays
+# otherwise.
+
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from simulation import *
+from headless import presets, wants_placement, make_seeded_world
+
+PLANE_TYPE = 0
+PLANE_DIRECTION = 1
+PLANE_HEALTH = 2
+PLANE_COOLDOWN = 3
+NUM_PLANES = 4
+
+# values of the type plane
+TYPE_EMPTY = 0
+TYPE_MARCHING = 1
+TYPE_FALLING = 2
+TYPE_DIRECTIONAL = 3
+TYPE_KNIGHT = 4
+TYPE_BISHOP = 5
+TYPE_LINK = 6
+
+# values of the direction plane; baddies face left or right
+DIRECTION_NONE = 0
+DIRECTION_LEFT = 1
+DIRECTION_RIGHT = 2
+DIRECTION_UP = 3
+DIRECTION_DOWN = 4
+
+directions = {
+    (-1, 0): DIRECTION_LEFT,
+    (1, 0): DIRECTION_RIGHT,
+    (0, -1): DIRECTION_UP,
+    (0, 1): DIRECTION_DOWN,
+}
+
+# next_turret is described by (type, direction, health)
+NEXT_TURRET_SIZE = 3
+
+def describe_object(obj, state):
+    if isinstance(obj, Baddie):
+        if isinstance(obj, FallingBaddie):
+            kind = TYPE_FALLING
+        else:
+            kind = TYPE_MARCHING
+        if state == -1:
+            return kind, DIRECTION_LEFT, 0, 0
+        return kind, DIRECTION_RIGHT, 0, 0
+    elif isinstance(obj, Turret):
+        if state is None:
+            cooldown, health = obj.get_initial_state()
+        else:
+            cooldown, health = state
+        if isinstance(obj, DirectionalTurret):
+            return TYPE_DIRECTIONAL, directions.get(obj.direction, DIRECTION_NONE), health, cooldown
+        elif isinstance(obj, KnightTurret):
+            return TYPE_KNIGHT, DIRECTION_NONE, health, cooldown
+        return TYPE_BISHOP, DIRECTION_NONE, health, cooldown
+    elif isinstance(obj, Link):
+        return TYPE_LINK, DIRECTION_NONE, 0, 0
+    return TYPE_EMPTY, DIRECTION_NONE, 0, 0
+
+# writes the NUM_PLANES planes of world into out, a flat sequence, at offset
+def encode_observation(world, out, offset):
+    cells = world.width * world.height
+    destroyed = world.destroyed_objects
+    for index, obj in enumerate(world.objects):
+        if obj is None or obj in destroyed:
+            kind = direction = health = cooldown = 0
+        else:
+            kind, direction, health, cooldown = describe_object(obj, world.object_state.get(obj))
+        out[offset + index] = kind
+        out[offset + cells + index] = direction
+        out[offset + cells * 2 + index] = health
+        out[offset + cells * 3 + index] = cooldown
+
+def encode_next_turret(world, out, offset):
+    kind, direction, health, cooldown = describe_object(world.next_turret, None)
+    out[offset] = kind
+    out[offset + 1] = direction
+    out[offset + 2] = health
+
+class SharedBuffers(object):
+    def __init__(self, num_envs, width, height):
+        cells = width * height
+        self.observations = multiprocessing.RawArray('h', num_envs * NUM_PLANES * cells)
+        self.next_turrets = multiprocessing.RawArray('h', num_envs * NEXT_TURRET_SIZE)
+        self.rewards = multiprocessing.RawArray('d', num_envs)
+        self.dones = multiprocessing.RawArray('b', num_envs)
+        # final score of the game that ended in the last step, if done
+        self.episode_scores = multiprocessing.RawArray('i', num_envs)
+        self.actions = multiprocessing.RawArray('i', num_envs)
+
+class EnvWorker(object):
+    def __init__(self, buffers, first, count, width, height, preset, seed, num_envs, max_ticks):
+        self.buffers = buffers
+        self.first = first
+        self.count = count
+        self.width = width
+        self.height = height
+        self.preset = preset
+        self.seed = seed
+        self.num_envs = num_envs
+        self.max_ticks = max_ticks
+        self.worlds = [None] * count
+        self.ticks = [0] * count
+        self.episodes = [0] * count
+
+    def write(self, i):
+        world = self.worlds[i]
+        env = self.first + i
+        encode_observation(world, self.buffers.observations, env * NUM_PLANES * self.width * self.height)
+        encode_next_turret(world, self.buffers.next_turrets, env * NEXT_TURRET_SIZE)
+
+    # advances until the player could place a turret, returning the score gained
+    def advance_to_decision(self, i):
+        world = self.worlds[i]
+        start_score = world.score
+        while True:
+            world = world.advance()
+            self.ticks[i] += 1
+            if world.lost or wants_placement(world) or self.ticks[i] >= self.max_ticks:
+                break
+        self.worlds[i] = world
+        return world.score - start_score
+
+    def reset(self, i):
+        env = self.first + i
+        seed = self.seed + env + self.num_envs * self.episodes[i]
+        self.episodes[i] += 1
+        self.worlds[i] = make_seeded_world(presets[self.preset], self.width, self.height, seed)
+        self.ticks[i] = 0
+        self.advance_to_decision(i)
+        self.write(i)
+
+    def reset_all(self):
+        for i in range(self.count):
+            self.reset(i)
+            self.buffers.rewards[self.first + i] = 0.0
+            self.buffers.dones[self.first + i] = 0
+
+    def step_all(self):
+        buffers = self.buffers
+        pass_action = self.width * self.height
+        for i in range(self.count):
+            env = self.first + i
+            world = self.worlds[i]
+            action = buffers.actions[env]
+            if 0 <= action < pass_action and wants_placement(world):
+                world.clicked(action % self.width, action // self.width)
+
+            buffers.rewards[env] = self.advance_to_decision(i)
+            world = self.worlds[i]
+            if world.lost or self.ticks[i] >= self.max_ticks:
+                buffers.dones[env] = 1
+                buffers.episode_scores[env] = world.score
+                self.reset(i)
+            else:
+                buffers.dones[env] = 0
+                self.write(i)
+
+def worker(connection, *args):
+    env_worker = EnvWorker(*args)
+    while True:
+        command = connection.recv()
+        if command == 'reset':
+            env_worker.reset_all()
+        elif command == 'step':
+            env_worker.step_all()
+        elif command == 'close':
+            connection.close()
+            return
+        connection.send(True)
+
+class VectorEnv(object):
+    def __init__(self, num_envs, width=6, height=8, preset='normal', processes=None, seed=0, max_ticks=10000):
+        self.num_envs = num_envs
+        self.width = width
+        self.height = height
+        self.num_actions = width * height + 1
+        self.pass_action = width * height
+        self.observation_shape = (NUM_PLANES, height, width)
+
+        self.buffers = SharedBuffers(num_envs, width, height)
+
+        processes = min(num_envs, processes or multiprocessing.cpu_count())
+        self.connections = []
+        self.processes = []
+        first = 0
+        for i in range(processes):
+            count = (num_envs - first) // (processes - i)
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker, args=(child, self.buffers, first, count,
+                width, height, preset, seed, num_envs, max_ticks))
+            process.daemon = True
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+            first += count
+
+        if numpy is not None:
+            self.observations = numpy.frombuffer(self.buffers.observations, numpy.int16).reshape(
+                (num_envs,) + self.observation_shape)
+            self.next_turrets = numpy.frombuffer(self.buffers.next_turrets, numpy.int16).reshape(
+                num_envs, NEXT_TURRET_SIZE)
+            self.rewards = numpy.frombuffer(self.buffers.rewards, numpy.float64)
+            self.dones = numpy.frombuffer(self.buffers.dones, numpy.int8)
+            self.episode_scores = numpy.frombuffer(self.buffers.episode_scores, numpy.int32)
+            self.actions = numpy.frombuffer(self.buffers.actions, numpy.int32)
+        else:
+            self.observations = self.buffers.observations
+            self.next_turrets = self.buffers.next_turrets
+            self.rewards = self.buffers.rewards
+            self.dones = self.buffers.dones
+            self.episode_scores = self.buffers.episode_scores
+            self.actions = self.buffers.actions
+
+    def command(self, command):
+        for connection in self.connections:
+            connection.send(command)
+        for connection in self.connections:
+            connection.recv()
+
+    # the returned arrays are the shared buffers, overwritten by the next step
+    def reset(self):
+        self.command('reset')
+        return self.observations
+
+    def step(self, actions):
+        self.actions[:] = actions
+        self.command('step')
+        return self.observations, self.rewards, self.dones
+
+    def close(self):
+        for connection in self.connections:
+            connection.send('close')
+        for process in self.processes:
+            process.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the step rate of the environment with random actions.")
+    parser.add_argument("--envs", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--width", type=int, default=6)
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument("--preset", default="normal", choices=sorted(presets))
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    env = VectorEnv(args.envs, args.width, args.height, args.preset, args.processes)
+    try:
+        env.reset()
+        rng = random.Random(0)
+        games = 0
+        start = time.time()
+        for step in range(args.steps):
+            observations, rewards, dones = env.step(
+                [rng.randrange(env.num_actions) for i in range(args.envs)])
+            games += sum(1 for done in dones if done)
+        elapsed = time.time() - start
+    finally:
+        env.close()
+
+    sys.stdout.write("%s steps, %s finished games, %.0f steps per second\n" % (
+        args.envs * args.steps, games, args.envs * args.steps / max(elapsed, 1e-6)))
+
+if __name__ == '__main__':
+    main()
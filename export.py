@@ -0,0 +1,148 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Renders a recorded game (a list of World states, one per tick) to PNG
+# sequences or raw RGB frames without opening a window.
+
+import os
+import sys
+import pickle
+import argparse
+import multiprocessing
+
+from simulation import make_normal_game
+
+FRAMES_PER_TICK = 20
+
+FORMAT_PNG = "png"
+FORMAT_RAW = "raw"
+
+def record_game(world, ticks):
+    worlds = [world]
+    for i in range(ticks):
+        world = world.advance()
+        worlds.append(world)
+    return worlds
+
+def init_worker():
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+    import pygame
+    pygame.display.init()
+    pygame.font.init()
+
+def frame_path(path, frame):
+    return os.path.join(path, "frame%06d.png" % frame)
+
+def render_chunk(args):
+    # worlds are sent as one list so objects stay shared between ticks
+    worlds, first_tick, w, h, path, format, frames_per_tick = args
+
+    # pygame is only loaded in the workers, after init_worker selects the
+    # dummy driver
+    import pygame
+    from tower import draw_world
+
+    surface = pygame.Surface((w, h))
+    frame_size = w * h * 3
+
+    if format == FORMAT_RAW:
+        output = open(path, 'r+b')
+        output.seek(first_tick * frames_per_tick * frame_size)
+
+    try:
+        for i in range(len(worlds) - 1):
+            old_world, world = worlds[i], worlds[i+1]
+            for j in range(frames_per_tick):
+                t = j / float(frames_per_tick)
+                draw_world(old_world, world, t, surface, 0, 0, w, h)
+
+                frame = (first_tick + i) * frames_per_tick + j
+                if format == FORMAT_RAW:
+                    output.write(pygame.image.tostring(surface, 'RGB'))
+                else:
+                    pygame.image.save(surface, frame_path(path, frame))
+    finally:
+        if format == FORMAT_RAW:
+            output.close()
+
+    return (len(worlds) - 1) * frames_per_tick
+
+def export_frames(worlds, path, w, h, format=FORMAT_PNG, frames_per_tick=FRAMES_PER_TICK, processes=None, chunk_ticks=None):
+    ticks = len(worlds) - 1
+    if ticks <= 0:
+        return 0
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if chunk_ticks is None:
+        chunk_ticks = max(1, (ticks + processes * 4 - 1) // (processes * 4))
+
+    if format == FORMAT_RAW:
+        output = open(path, 'wb')
+        output.truncate(ticks * frames_per_tick * w * h * 3)
+        output.close()
+    elif not os.path.isdir(path):
+        os.makedirs(path)
+
+    chunks = []
+    for first_tick in range(0, ticks, chunk_ticks):
+        last_tick = min(first_tick + chunk_ticks, ticks)
+        chunks.append((worlds[first_tick:last_tick+1], first_tick, w, h, path, format, frames_per_tick))
+
+    pool = multiprocessing.Pool(processes, init_worker)
+    try:
+        frames = sum(pool.map(render_chunk, chunks))
+    finally:
+        pool.close()
+        pool.join()
+
+    return frames
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a recorded game to image files.")
+    parser.add_argument("output", help="directory for PNG frames, or file for raw RGB frames")
+    parser.add_argument("--input", help="pickled list of World states (default: record a new normal game)")
+    parser.add_argument("--ticks", type=int, default=100, help="ticks to record when no input is given")
+    parser.add_argument("--raw", action="store_true", help="write raw RGB frames to a single file")
+    parser.add_argument("--tile-size", type=int, default=64)
+    parser.add_argument("--frames-per-tick", type=int, default=FRAMES_PER_TICK)
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args()
+
+    if args.input:
+        f = open(args.input, 'rb')
+        try:
+            worlds = pickle.load(f)
+        finally:
+            f.close()
+    else:
+        worlds = record_game(make_normal_game(6, 8), args.ticks)
+
+    w = worlds[0].width * args.tile_size
+    h = worlds[0].height * args.tile_size
+
+    if args.raw:
+        format = FORMAT_RAW
+    else:
+        format = FORMAT_PNG
+
+    frames = export_frames(worlds, args.output, w, h, format, args.frames_per_tick, args.processes)
+
+    sys.stderr.write("wrote %s frames of %sx%s\n" % (frames, w, h))
+
+if __name__ == '__main__':
+    main()
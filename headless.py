@@ -0,0 +1,472 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Plays games without a display, for statistics and tuning.
+
+import os
+import sys
+import time
+import array
+import random
+import argparse
+import multiprocessing
+
+from simulation import *
+from stats import ColumnWriter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+presets = {
+    'easy': make_easy_game,
+    'normal': make_normal_game,
+    'hard': make_hard_game,
+    'insane': make_insane_game,
+}
+
+TURRET_KINDS = ('directional', 'knight', 'bishop')
+
+def turret_kind(turret):
+    if isinstance(turret, DirectionalTurret):
+        return 'directional'
+    elif isinstance(turret, KnightTurret):
+        return 'knight'
+    elif isinstance(turret, BishopTurret):
+        return 'bishop'
+
+GAME_COLUMNS = [
+    ('game', 'q'),
+    ('seed', 'q'),
+    ('score', 'q'),
+    ('num_waves', 'q'),
+    ('ticks', 'q'),
+    ('lost_tick', 'q'),
+] + [('placed_%s' % kind, 'q') for kind in TURRET_KINDS] + [
+     ('kills_%s' % kind, 'q') for kind in TURRET_KINDS]
+
+TICK_COLUMNS = [
+    ('game', 'q'),
+    ('tick', 'q'),
+    ('score', 'q'),
+    ('baddies', 'q'),
+    ('turrets', 'q'),
+    ('kills', 'q'),
+]
+
+class GameResult(object):
+    def __init__(self):
+        self.game = 0
+        self.seed = 0
+        self.score = 0
+        self.num_waves = 0
+        self.ticks = 0
+        # -1 when the game did not end within the tick limit
+        self.lost_tick = -1
+        self.placed = dict((kind, 0) for kind in TURRET_KINDS)
+        self.kills = dict((kind, 0) for kind in TURRET_KINDS)
+
+    def record(self):
+        result = [self.game, self.seed, self.score, self.num_waves, self.ticks, self.lost_tick]
+        result.extend(self.placed[kind] for kind in TURRET_KINDS)
+        result.extend(self.kills[kind] for kind in TURRET_KINDS)
+        return result
+
+# cell codes used by encode_board
+CELL_EMPTY = 0
+CELL_MARCHING = 1
+CELL_FALLING = 2
+CELL_LEFT = 3
+CELL_RIGHT = 4
+CELL_UP = 5
+CELL_DOWN = 6
+CELL_KNIGHT = 7
+CELL_BISHOP = 8
+CELL_LINK = 9
+CELL_OTHER = 10
+
+directional_codes = {
+    (-1, 0): CELL_LEFT,
+    (1, 0): CELL_RIGHT,
+    (0, -1): CELL_UP,
+    (0, 1): CELL_DOWN,
+}
+
+def cell_code(obj):
+    if obj is None:
+        return CELL_EMPTY
+    elif isinstance(obj, MarchingBaddie):
+        return CELL_MARCHING
+    elif isinstance(obj, FallingBaddie):
+        return CELL_FALLING
+    elif isinstance(obj, DirectionalTurret):
+        return directional_codes[obj.direction]
+    elif isinstance(obj, KnightTurret):
+        return CELL_KNIGHT
+    elif isinstance(obj, BishopTurret):
+        return CELL_BISHOP
+    elif isinstance(obj, Link):
+        return CELL_LINK
+    return CELL_OTHER
+
+# appends one byte per cell, row by row, to out; destroyed objects are empty
+def encode_board(world, out=None):
+    if out is None:
+        out = array.array('B')
+    destroyed = world.destroyed_objects
+    out.extend(CELL_EMPTY if obj in destroyed else cell_code(obj) for obj in world.objects)
+    return out
+
+# encodes worlds of the same size into (boards, next_turrets), where boards
+# holds len(worlds) * width * height bytes and next_turrets one code per world;
+# numpy.frombuffer(boards, numpy.uint8).reshape(-1, height, width) views it
+# without copying
+def encode_boards(worlds):
+    boards = array.array('B')
+    next_turrets = array.array('B')
+    for world in worlds:
+        encode_board(world, boards)
+        next_turrets.append(cell_code(world.next_turret))
+    return boards, next_turrets
+
+def empty_cells(world):
+    destroyed = world.destroyed_objects
+    result = []
+    for y in range(1, world.height):
+        for x in range(world.width):
+            obj = world.objects[x + y * world.width]
+            if obj is None or obj in destroyed:
+                result.append((x, y))
+    return result
+
+# A policy chooses where to place world.next_turret, given a world where a
+# turret can be placed. choose(world) returns (x, y), or None to wait.
+# choose_batch(worlds) returns one of those for each world, and is what the
+# headless games call; batched policies override it and work on encode_boards.
+class Policy(object):
+    def choose(self, world):
+        return self.choose_batch([world])[0]
+
+    def choose_batch(self, worlds):
+        return [self.choose(world) for world in worlds]
+
+class RandomPolicy(Policy):
+    def choose(self, world):
+        cells = empty_cells(world)
+        if cells:
+            return world.rng.choice(cells)
+
+# cells a turret of the given code would cover from each cell of an empty
+# board, as lists of cell indices
+coverage_tables = {}
+
+def get_coverage_table(code, width, height):
+    key = (code, width, height)
+    table = coverage_tables.get(key)
+    if table is None:
+        if code in (CELL_LEFT, CELL_RIGHT, CELL_UP, CELL_DOWN):
+            turret = DirectionalTurret()
+            for direction, direction_code in directional_codes.items():
+                if direction_code == code:
+                    turret.direction = direction
+        elif code == CELL_KNIGHT:
+            turret = KnightTurret()
+        else:
+            turret = BishopTurret()
+        world = World.__new__(World)
+        world.width = width
+        world.height = height
+        world.objects = [None] * (width * height)
+        table = []
+        for y in range(height):
+            for x in range(width):
+                table.append([cx + cy * width for cx, cy in turret.get_covered_locations_at(world, x, y)])
+        coverage_tables[key] = table
+    return table
+
+# coverage tables as transposed matrices, for scoring with numpy: entry
+# [covered, index] is 1 if a turret at index covers covered
+coverage_matrices = {}
+
+def get_coverage_matrix(code, width, height):
+    key = (code, width, height)
+    matrix = coverage_matrices.get(key)
+    if matrix is None:
+        size = width * height
+        matrix = numpy.zeros((size, size), numpy.float32)
+        for index, covered in enumerate(get_coverage_table(code, width, height)):
+            matrix[covered, index] = 1
+        coverage_matrices[key] = matrix
+    return matrix
+
+# Greedily places the turret where it covers the most baddies, then the most
+# open cells. Line of sight through existing turrets is ignored, which lets a
+# whole batch be scored with one matrix product when numpy is available.
+class CoveragePolicy(Policy):
+    baddie_weight = 4
+    empty_weight = 1
+
+    def choose_batch(self, worlds):
+        result = [None] * len(worlds)
+        # group by board size and turret, so each group shares a table
+        groups = {}
+        for i, world in enumerate(worlds):
+            key = (world.width, world.height, cell_code(world.next_turret))
+            groups.setdefault(key, []).append(i)
+        for (width, height, code), indices in groups.items():
+            boards, next_turrets = encode_boards([worlds[i] for i in indices])
+            if numpy is not None:
+                cells = self.choose_numpy(boards, code, width, height)
+            else:
+                cells = self.choose_python(boards, get_coverage_table(code, width, height), width, height)
+            for i, cell in zip(indices, cells):
+                result[i] = cell
+        return result
+
+    def choose_numpy(self, boards, code, width, height):
+        size = width * height
+        boards = numpy.frombuffer(boards, numpy.uint8).reshape(-1, size)
+        coverage = get_coverage_matrix(code, width, height)
+        is_baddie = (boards == CELL_MARCHING) | (boards == CELL_FALLING)
+        weights = numpy.where(is_baddie, self.baddie_weight,
+                              numpy.where(boards == CELL_EMPTY, self.empty_weight, 0)).astype(numpy.float32)
+        scores = weights.dot(coverage)
+        # only empty cells below the spawn row can be used
+        scores[boards != CELL_EMPTY] = -1
+        scores[:, :width] = -1
+        # plain ints, as numpy ints overflow in World's hashing
+        best = [int(index) for index in scores.argmax(axis=1)]
+        return [None if scores[i, index] < 0 else (index % width, index // width)
+                for i, index in enumerate(best)]
+
+    def choose_python(self, boards, table, width, height):
+        size = width * height
+        result = []
+        for start in range(0, len(boards), size):
+            board = boards[start:start+size]
+            weights = [self.baddie_weight if code in (CELL_MARCHING, CELL_FALLING) else
+                       self.empty_weight if code == CELL_EMPTY else 0 for code in board]
+            best = None
+            best_score = -1
+            for index in range(width, size):
+                if board[index] != CELL_EMPTY:
+                    continue
+                score = sum(weights[covered] for covered in table[index])
+                if score > best_score:
+                    best = (index % width, index // width)
+                    best_score = score
+            result.append(best)
+        return result
+
+policies = {
+    'random': RandomPolicy,
+    'coverage': CoveragePolicy,
+}
+
+# whether run() would stop and wait for the player to place a turret
+def wants_placement(world):
+    return (world.place_turret_cooldown <= world.place_turret_points and
+            not world.click_to_baddie and not world.lost)
+
+# counts the kills and, if count_objects, the objects of a tick, so the
+# ticks the oracle stands in for can be counted with count_tick
+def describe_tick(world, count_objects):
+    kills = []
+    for obj, destroyer in world.destroyed_objects.items():
+        if isinstance(obj, Baddie) and isinstance(destroyer, Turret):
+            kills.append(turret_kind(destroyer))
+
+    baddies = turrets = 0
+    if count_objects:
+        for obj in world.objects:
+            if isinstance(obj, Baddie):
+                baddies += 1
+            elif isinstance(obj, Turret):
+                turrets += 1
+
+    return kills, baddies, turrets
+
+def count_tick(result, tick_info, tick, score, tick_sink):
+    kills, baddies, turrets = tick_info
+    result.ticks += 1
+    for kind in kills:
+        result.kills[kind] += 1
+    if tick_sink is not None:
+        tick_sink.append((result.game, tick, score, baddies, turrets, len(kills)))
+
+# makes a world with a random number generator of its own, seeded with seed,
+# so its game plays the same whatever it's batched with
+def make_seeded_world(make_world, width, height, seed):
+    random.seed(seed)
+    world = make_world(width, height)
+    # the game goes on from where making the world left off, as it would
+    # if it were played alone after random.seed(seed)
+    world.rng = random.Random()
+    world.rng.setstate(random.getstate())
+    return world
+
+# plays games in lockstep, asking the policy to decide for all the games that
+# can place a turret at once; tick_sink, if given, gets a TICK_COLUMNS record
+# per game per tick; oracle, an oracle.EndgameOracle, stops simulating games
+# whose end it has found, within the tolerance described in oracle.py
+def play_games_batched(worlds, policy=None, max_ticks=10000, tick_sink=None, first_game=0, oracle=None):
+    if policy is None:
+        policy = RandomPolicy()
+
+    results = []
+    for i in range(len(worlds)):
+        result = GameResult()
+        result.game = first_game + i
+        results.append(result)
+
+    worlds = list(worlds)
+    live = list(range(len(worlds)))
+
+    for tick in range(max_ticks):
+        if not live:
+            break
+
+        placed = set()
+        deciding = [i for i in live if wants_placement(worlds[i]) and
+                    not (oracle is not None and oracle.is_replaying(i))]
+        if deciding:
+            cells = policy.choose_batch([worlds[i] for i in deciding])
+            for i, cell in zip(deciding, cells):
+                if cell is not None:
+                    world = worlds[i]
+                    turret = world.next_turret
+                    if world.clicked(cell[0], cell[1]) is True:
+                        results[i].placed[turret_kind(turret)] += 1
+                        placed.add(i)
+
+        still_live = []
+        for i in live:
+            old_world = worlds[i]
+            result = results[i]
+            replaying = oracle is not None and oracle.is_replaying(i)
+            if replaying:
+                world, tick_info = oracle.advance(i, old_world)
+            else:
+                world = old_world.advance()
+                tick_info = describe_tick(world, tick_sink is not None)
+            worlds[i] = world
+            count_tick(result, tick_info, tick, world.score, tick_sink)
+
+            if world.lost:
+                result.lost_tick = tick
+                if oracle is not None:
+                    oracle.finished(i)
+            else:
+                if oracle is not None and not replaying:
+                    oracle.advanced(i, old_world, world, i in placed, tick_info)
+                still_live.append(i)
+        live = still_live
+
+    for world, result in zip(worlds, results):
+        result.score = world.score
+        result.num_waves = world.num_waves
+    return results
+
+def play_game(world, policy=None, max_ticks=10000, tick_sink=None, game=0, oracle=None):
+    return play_games_batched([world], policy, max_ticks, tick_sink, game, oracle)[0]
+
+def play_games(args):
+    preset, policy_name, width, height, games, first_game, seed, max_ticks, output, use_oracle, hold_window, loss_lookahead = args
+
+    game_sink = tick_sink = None
+    if output:
+        game_sink = ColumnWriter("%s.games.%d.col" % (output, os.getpid()), GAME_COLUMNS)
+        tick_sink = ColumnWriter("%s.ticks.%d.col" % (output, os.getpid()), TICK_COLUMNS)
+
+    try:
+        worlds = []
+        for game in range(first_game, first_game + games):
+            worlds.append(make_seeded_world(presets[preset], width, height, seed + game))
+
+        oracle = None
+        if use_oracle:
+            from oracle import EndgameOracle
+            oracle = EndgameOracle(hold_window=hold_window, loss_lookahead=loss_lookahead)
+
+        results = play_games_batched(worlds, policies[policy_name](), max_ticks, tick_sink, first_game, oracle)
+        for result in results:
+            result.seed = seed + result.game
+            if game_sink is not None:
+                game_sink.append(result.record())
+    finally:
+        if game_sink is not None:
+            game_sink.close()
+            tick_sink.close()
+
+    found = (0, 0, 0, 0)
+    if oracle is not None:
+        found = (oracle.cycles_found, oracle.holds_found, oracle.losses_found, oracle.ticks_saved)
+    return [result.score for result in results], found
+
+def main():
+    from oracle import HOLD_WINDOW
+
+    parser = argparse.ArgumentParser(description="Play games without a display and record statistics.")
+    parser.add_argument("--preset", default="normal", choices=sorted(presets))
+    parser.add_argument("--width", type=int, default=6)
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument("--policy", default="random", choices=sorted(policies))
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=64, help="games played in lockstep by each worker")
+    parser.add_argument("--max-ticks", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--output", help="prefix for column files, one pair per worker process")
+    parser.add_argument("--no-oracle", dest="oracle", action="store_false",
+                        help="simulate every tick, even of games that repeat forever")
+    parser.add_argument("--hold-window", type=int, default=HOLD_WINDOW,
+                        help="ticks a game has to hold its baddies at the top for the oracle to take it to hold forever, 0 to simulate them all")
+    parser.add_argument("--loss-lookahead", type=int, default=0,
+                        help="ticks the oracle plays an overrun game ahead without placements, to end it early if it loses")
+    args = parser.parse_args()
+
+    processes = args.processes or multiprocessing.cpu_count()
+    chunk = max(1, min(args.batch, args.games // processes))
+
+    jobs = []
+    for first_game in range(0, args.games, chunk):
+        jobs.append((args.preset, args.policy, args.width, args.height, min(chunk, args.games - first_game),
+                     first_game, args.seed, args.max_ticks, args.output, args.oracle,
+                     args.hold_window, args.loss_lookahead))
+
+    start = time.time()
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        scores = []
+        found = [0, 0, 0, 0]
+        for results, worker_found in pool.imap_unordered(play_games, jobs):
+            scores.extend(results)
+            found = [a + b for a, b in zip(found, worker_found)]
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = time.time() - start
+
+    sys.stdout.write("%s games, mean score %.1f, %.1f games per second\n" % (
+        len(scores), sum(scores) / float(max(1, len(scores))), len(scores) / max(elapsed, 1e-6)))
+    if args.oracle:
+        sys.stdout.write("oracle: %s cycles, %s held for %s ticks, %s losses looked ahead to, %s ticks not simulated\n" % (
+            found[0], found[1], args.hold_window, found[2], found[3]))
+
+if __name__ == '__main__':
+    main()
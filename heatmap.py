@@ -0,0 +1,185 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Estimates how useful it would be to place World.next_turret on each cell,
+# using short simulated rollouts in a background process.
+
+import copy
+import pickle
+import random
+import signal
+import threading
+import multiprocessing
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from simulation import *
+
+ROLLOUT_TICKS = 30
+
+MAX_ROUNDS = 64
+
+MAX_BOARDS = 256
+
+def object_key(obj, world):
+    if obj is None:
+        return None
+    if isinstance(obj, DirectionalTurret):
+        return (type(obj).__name__, obj.direction, obj.starting_health, world.get_state(obj))
+    if isinstance(obj, Turret):
+        return (type(obj).__name__, obj.starting_health, world.get_state(obj))
+    return (type(obj).__name__, world.get_state(obj), world.is_destroyed(obj))
+
+# identifies boards that would give the same heatmap
+def board_key(world):
+    return (world.width, world.height,
+        tuple(object_key(obj, world) for obj in world.objects),
+        object_key(world.next_turret, world))
+
+def candidate_cells(world):
+    result = []
+    for y in range(1, world.height):
+        for x in range(world.width):
+            if not isinstance(world.get_object(x, y), Link):
+                result.append((x, y))
+    return result
+
+# plays ROLLOUT_TICKS ticks after placing next_turret at (x, y), returns
+# (kills by the new turret, ticks survived)
+def rollout(world, x, y, ticks=ROLLOUT_TICKS):
+    world = copy.deepcopy(world)
+    turret = world.next_turret
+    world.add_object(x, y, turret)
+
+    kills = 0
+    survived = 0
+    for i in range(ticks):
+        world = world.advance()
+        for obj, destroyer in world.destroyed_objects.items():
+            if destroyer is turret:
+                kills += 1
+        if world.lost:
+            break
+        survived += 1
+
+    return kills, survived
+
+def normalize(totals, rounds):
+    result = {}
+    if not rounds:
+        return result
+    best = 0.0
+    for cell, (kills, survived) in totals.items():
+        value = (kills + survived / float(ROLLOUT_TICKS)) / rounds
+        result[cell] = value
+        best = max(best, value)
+    if best > 0:
+        for cell in result:
+            result[cell] /= best
+    return result
+
+def worker(requests, results):
+    # forked from a process using SDL, which turns SIGTERM into a quit event
+    # nobody here reads, so the process couldn't be terminated at exit
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    random.seed()
+
+    # key -> [world, {cell: [kills, survived]}, rounds]
+    boards = {}
+    current = None
+
+    while True:
+        try:
+            if current is None or boards[current][2] >= MAX_ROUNDS:
+                request = requests.get()
+            else:
+                request = requests.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            if request is None:
+                return
+            key, data = request
+            if key in boards:
+                world, totals, rounds = boards[key]
+                if rounds:
+                    results.put((key, normalize(totals, rounds), rounds))
+            else:
+                if len(boards) >= MAX_BOARDS:
+                    boards.clear()
+                world = pickle.loads(data)
+                boards[key] = [world, dict((cell, [0, 0]) for cell in candidate_cells(world)), 0]
+            current = key
+            continue
+
+        world, totals, rounds = boards[current]
+        for cell, total in totals.items():
+            kills, survived = rollout(world, cell[0], cell[1])
+            total[0] += kills
+            total[1] += survived
+        rounds += 1
+        boards[current][2] = rounds
+
+        results.put((current, normalize(totals, rounds), rounds))
+
+class PlacementHeatmap(object):
+    # lock is held while pickling, as another thread advancing the world
+    # leaves flags on its objects for a while
+    def __init__(self, lock=None):
+        self.lock = lock or threading.Lock()
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=worker, args=(self.requests, self.results))
+        self.process.daemon = True
+        self.process.start()
+
+        self.key = None
+        self.values = {}
+        self.rounds = 0
+
+    def update(self, world):
+        if world.click_to_baddie or not world.game_ui or world.lost:
+            self.key = None
+            self.values = {}
+            return
+
+        key = board_key(world)
+        if key != self.key:
+            self.key = key
+            self.values = {}
+            self.rounds = 0
+            # pickle now, as the world may change before the queue's feeder
+            # thread gets to it
+            with self.lock:
+                data = pickle.dumps(world, pickle.HIGHEST_PROTOCOL)
+            self.requests.put((key, data))
+
+    def poll(self):
+        while True:
+            try:
+                key, values, rounds = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if key == self.key and rounds > self.rounds:
+                self.values = values
+                self.rounds = rounds
+        return self.values
+
+    def close(self):
+        self.requests.put(None)
+        self.process.join(1)
@@ -0,0 +1,113 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Traces input events from when run() receives them to the display flip that
+# first shows their result, timing each stage in between.
+
+import sys
+import time
+
+from stats import Distribution
+
+# milliseconds per bin of the latency distributions
+BIN_MS = 0.1
+
+class Trace(object):
+    def __init__(self, kind):
+        self.kind = kind
+        self.stages = [('received', time.time())]
+
+    def stage(self, name):
+        self.stages.append((name, time.time()))
+
+class LatencyTracer(object):
+    def __init__(self):
+        # traces waiting for the next flip
+        self.pending = []
+        # kind -> Distribution of milliseconds from receiving to flip
+        self.totals = {}
+        # (kind, from stage, to stage) -> Distribution of milliseconds
+        self.steps = {}
+        # (kind, from stage, to stage) -> total milliseconds from receiving
+        # the event to the step starting, for ordering the report
+        self.step_starts = {}
+
+    def begin(self, kind):
+        trace = Trace(kind)
+        self.pending.append(trace)
+        return trace
+
+    # marks a stage for every trace still waiting to be shown
+    def stage_all(self, name):
+        for trace in self.pending:
+            trace.stage(name)
+
+    def flipped(self):
+        self.stage_all('flipped')
+        for trace in self.pending:
+            self.record(trace)
+        self.pending = []
+
+    def get_distribution(self, table, key):
+        distribution = table.get(key)
+        if distribution is None:
+            distribution = table[key] = Distribution(BIN_MS)
+        return distribution
+
+    def record(self, trace):
+        start = trace.stages[0][1]
+        end = trace.stages[-1][1]
+        self.get_distribution(self.totals, trace.kind).add_values([(end - start) * 1000])
+        for (from_name, from_time), (to_name, to_time) in zip(trace.stages, trace.stages[1:]):
+            key = (trace.kind, from_name, to_name)
+            self.get_distribution(self.steps, key).add_values([(to_time - from_time) * 1000])
+            self.step_starts[key] = self.step_starts.get(key, 0.0) + (from_time - start) * 1000
+
+    def report(self, out=sys.stderr):
+        out.write("input latency in ms, from receiving the event to the flip showing it:\n")
+        out.write("%-44s %8s %8s %8s %8s %8s\n" % ("kind / stage", "count", "p50", "p90", "p99", "max"))
+        for kind in sorted(self.totals):
+            distribution = self.totals[kind]
+            out.write("%-44s %8s %8.1f %8.1f %8.1f %8.1f\n" % (kind, distribution.count,
+                distribution.percentile(0.5), distribution.percentile(0.9),
+                distribution.percentile(0.99), distribution.maximum))
+            steps = [key for key in self.steps if key[0] == kind]
+            # in the order the stages usually happen, by when they start on
+            # average
+            steps.sort(key=lambda key: self.step_starts[key] / self.steps[key].count)
+            for key in steps:
+                distribution = self.steps[key]
+                out.write("  %-42s %8s %8.1f %8.1f %8.1f %8.1f\n" % ("%s -> %s" % key[1:], distribution.count,
+                    distribution.percentile(0.5), distribution.percentile(0.9),
+                    distribution.percentile(0.99), distribution.maximum))
+
+# stands in for LatencyTracer when tracing is off
+class NullTrace(object):
+    kind = None
+
+    def stage(self, name):
+        pass
+
+class NullTracer(object):
+    trace = NullTrace()
+
+    def begin(self, kind):
+        return self.trace
+
+    def stage_all(self, name):
+        pass
+
+    def flipped(self):
+        pass
@@ -0,0 +1,147 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Predicts where the baddies on the board will go over the next few ticks,
+# once as if no turrets fired and once with them firing. Predictions are
+# extended a few ticks per frame, within a time budget, and kept until the
+# world changes.
+
+import time
+import random
+import threading
+
+from simulation import *
+
+PREDICTION_TICKS = 20
+
+# seconds of each frame to spend on predictions
+FRAME_BUDGET = 0.004
+
+PREDICT_STILL = 0
+PREDICT_SHOOTING = 1
+
+class Prediction(object):
+    def __init__(self, world, shoot, random_state):
+        self.shoot = shoot
+        # advance appends to waves, so the prediction needs its own copy
+        self.world = world.copy()
+        self.random_state = random_state
+        self.ticks = 0
+        # baddie -> [(x, y), ...], starting where it is now
+        self.paths = {}
+        # baddies destroyed during the prediction
+        self.destroyed = set()
+        # cells any baddie tried to move to, or was in
+        self.touched = set()
+        # whether new random waves were made
+        self.made_waves = False
+
+        for obj in world.objects:
+            if isinstance(obj, Baddie) and not world.is_destroyed(obj):
+                self.paths[obj] = [world.get_location(obj)]
+
+    def step(self):
+        world = self.world
+        for obj in world.objects:
+            if isinstance(obj, Baddie) and not world.is_destroyed(obj):
+                self.touched.add(world.get_location(obj))
+                for x, y, state in obj.get_preferred_locations(world):
+                    self.touched.add((x, y))
+        if len(world.waves) < world.num_waves:
+            self.made_waves = True
+
+        # the prediction has its own random numbers, so it doesn't change
+        # what the real game does
+        state = random.getstate()
+        random.setstate(self.random_state)
+        try:
+            world = self.world = world.advance(self.shoot)
+        finally:
+            self.random_state = random.getstate()
+            random.setstate(state)
+
+        self.ticks += 1
+        for obj, path in self.paths.items():
+            if obj in self.destroyed:
+                continue
+            if world.is_destroyed(obj):
+                self.destroyed.add(obj)
+            path.append(world.get_location(obj))
+
+    # a turret was put on (x, y) in the world this prediction started from;
+    # returns whether the prediction is still right
+    def add_turret(self, x, y, turret, state):
+        if self.shoot or (x, y) in self.touched or self.made_waves:
+            return False
+        cooldown, health = state
+        self.world.add_object(x, y, turret, (max(0, cooldown - self.ticks), health))
+        return True
+
+class TrajectoryPredictor(object):
+    # lock is held while advancing, for sharing objects with other threads
+    def __init__(self, ticks=PREDICTION_TICKS, budget=FRAME_BUDGET, lock=None):
+        self.ticks = ticks
+        self.budget = budget
+        self.lock = lock or threading.Lock()
+        self.world = None
+        self.predictions = []
+        self.steps = 0
+
+    def reset(self, world):
+        self.world = world
+        with self.lock:
+            random_state = random.getstate()
+        self.predictions = [Prediction(world, False, random_state),
+                            Prediction(world, True, random_state)]
+
+    def invalidate(self):
+        self.world = None
+        self.predictions = []
+
+    # the player put a turret on (x, y); only predictions it affects restart
+    def placed(self, world, x, y):
+        if world is not self.world:
+            return
+        turret = world.get_object(x, y)
+        with self.lock:
+            random_state = random.getstate()
+        for i, prediction in enumerate(self.predictions):
+            if not prediction.add_turret(x, y, turret, world.get_state(turret)):
+                self.predictions[i] = Prediction(world, prediction.shoot, random_state)
+
+    def unfinished(self):
+        return [prediction for prediction in self.predictions
+                if prediction.ticks < self.ticks and not prediction.world.lost]
+
+    # extends the predictions for world within the time budget
+    def update(self, world):
+        if world is not self.world:
+            self.reset(world)
+
+        deadline = time.time() + self.budget
+        while time.time() < deadline:
+            unfinished = self.unfinished()
+            if not unfinished:
+                break
+            prediction = min(unfinished, key=lambda prediction: prediction.ticks)
+            with self.lock:
+                prediction.step()
+            self.steps += 1
+
+    def get_paths(self, kind):
+        if not self.predictions:
+            return {}, set()
+        prediction = self.predictions[kind]
+        return prediction.paths, prediction.destroyed
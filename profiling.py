@@ -0,0 +1,249 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Opt-in allocation profiler. Attributes memory allocated by the simulation
+# and render phases to each tick, using tracemalloc and gc callbacks, and
+# diffs periodic snapshots to find memory that keeps growing.
+#
+# Phases nest, and each one is only charged for what happens outside the
+# phases nested in it. Measurements are process-wide, so everything that
+# allocates should run on the thread calling tick().
+
+import gc
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+from stats import Distribution
+
+# (object, attribute, phase name) for everything install() wraps; the render
+# phases are in renderer, the tower module, which is __main__ when the game
+# is run as python tower.py
+def default_targets(renderer=None):
+    import simulation
+    targets = [
+        (simulation.World, 'make_next_world', 'sim.new_world'),
+        (simulation.World, 'spawn_waves', 'sim.waves'),
+        (simulation.World, 'move_objects', 'sim.move'),
+        (simulation.World, 'shoot_objects', 'sim.shoot'),
+        (simulation.World, 'shoot_objects_masked', 'sim.shoot'),
+        (simulation.World, 'finish_tick', 'sim.finish'),
+        (simulation.World, 'advance', 'sim.advance'),
+    ]
+    if renderer is None:
+        renderer = sys.modules.get('tower')
+    if renderer is None and hasattr(sys.modules.get('__main__'), 'draw_world'):
+        renderer = sys.modules['__main__']
+    if renderer is not None:
+        tower = renderer
+        targets.extend([
+            (tower, 'draw_world', 'render.draw_world'),
+            (tower, 'get_tick_layout', 'render.layout'),
+            (tower.TickLayout, 'get_static_layer', 'render.static'),
+            (tower.TickLayout, 'get_coverage_layer', 'render.coverage'),
+            (tower, 'blit_all', 'render.blits'),
+            (tower, 'draw_text', 'render.text'),
+        ])
+    return targets
+
+class PhaseTotals(object):
+    def __init__(self):
+        self.calls = 0
+        # net change in traced memory
+        self.bytes = 0
+        # highest traced memory reached above the start of each measurement
+        self.peak = 0
+        # net change in allocated memory blocks, roughly a count of objects
+        self.blocks = 0
+        self.collections = 0
+        self.gc_time = 0.0
+
+class AllocationProfiler(object):
+    def __init__(self, snapshot_interval=1000, frames=1, out=sys.stderr, renderer=None):
+        if tracemalloc is None:
+            raise RuntimeError("allocation profiling needs tracemalloc (python 3.4 or later)")
+        self.snapshot_interval = snapshot_interval
+        self.frames = frames
+        self.out = out
+        self.renderer = renderer
+
+        self.stack = []
+        self.current = {}
+        self.per_tick = {}
+        self.ticks = 0
+        self.installed = []
+
+        self.gc_start = None
+
+        self.baseline = None
+        self.previous = None
+        self.growing = {}
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        gc.callbacks.append(self.gc_callback)
+        self.install(default_targets(self.renderer))
+        self.reset_counters()
+
+    def stop(self):
+        self.uninstall()
+        if self.gc_callback in gc.callbacks:
+            gc.callbacks.remove(self.gc_callback)
+        tracemalloc.stop()
+
+    def install(self, targets):
+        for owner, attribute, name in targets:
+            function = owner.__dict__[attribute]
+            setattr(owner, attribute, self.wrap(function, name))
+            self.installed.append((owner, attribute, function))
+
+    def uninstall(self):
+        while self.installed:
+            owner, attribute, function = self.installed.pop()
+            setattr(owner, attribute, function)
+
+    def wrap(self, function, name):
+        profiler = self
+        def wrapper(*args, **kwargs):
+            profiler.enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.exit()
+        wrapper.__name__ = function.__name__
+        return wrapper
+
+    def reset_counters(self):
+        self.last_bytes = tracemalloc.get_traced_memory()[0]
+        self.last_blocks = sys.getallocatedblocks()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def get_totals(self, name):
+        totals = self.current.get(name)
+        if totals is None:
+            totals = self.current[name] = PhaseTotals()
+        return totals
+
+    # charges everything since the last flush to the innermost phase, or to
+    # 'other' outside of any phase
+    def flush(self):
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks()
+        totals = self.get_totals(self.stack[-1] if self.stack else 'other')
+        totals.bytes += current - self.last_bytes
+        totals.blocks += blocks - self.last_blocks
+        if hasattr(tracemalloc, 'reset_peak'):
+            totals.peak = max(totals.peak, peak - self.last_bytes)
+        self.last_bytes = current
+        self.last_blocks = blocks
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def enter(self, name):
+        self.flush()
+        self.stack.append(name)
+        self.get_totals(name).calls += 1
+
+    def exit(self):
+        self.flush()
+        self.stack.pop()
+
+    def gc_callback(self, phase, info):
+        if phase == 'start':
+            self.gc_start = time.time()
+        elif self.gc_start is not None:
+            totals = self.get_totals(self.stack[-1] if self.stack else 'other')
+            totals.collections += 1
+            totals.gc_time += time.time() - self.gc_start
+            self.gc_start = None
+
+    # ends the current tick, and takes a snapshot every snapshot_interval ticks
+    def tick(self):
+        self.flush()
+        for name, totals in self.current.items():
+            distributions = self.per_tick.get(name)
+            if distributions is None:
+                distributions = self.per_tick[name] = {
+                    'calls': Distribution(),
+                    'bytes': Distribution(64),
+                    'peak': Distribution(64),
+                    'blocks': Distribution(),
+                    'collections': Distribution(),
+                    'gc_ms': Distribution(0.1),
+                }
+            distributions['calls'].add_values([totals.calls])
+            distributions['bytes'].add_values([totals.bytes])
+            distributions['peak'].add_values([totals.peak])
+            distributions['blocks'].add_values([totals.blocks])
+            distributions['collections'].add_values([totals.collections])
+            distributions['gc_ms'].add_values([totals.gc_time * 1000])
+        self.current = {}
+        self.ticks += 1
+
+        if self.snapshot_interval and self.ticks % self.snapshot_interval == 0:
+            self.snapshot()
+            # the snapshot itself allocates a lot
+            self.reset_counters()
+
+    def take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    # compares against the previous snapshot; lines whose memory grows in
+    # every interval are reported as possible leaks
+    def snapshot(self):
+        snapshot = self.take_snapshot()
+        if self.baseline is None:
+            self.baseline = snapshot
+        elif self.previous is not None:
+            growing = {}
+            for difference in snapshot.compare_to(self.previous, 'lineno'):
+                if difference.size_diff > 0:
+                    key = str(difference.traceback)
+                    growing[key] = self.growing.get(key, 0) + 1
+            self.growing = growing
+
+            self.out.write("tick %s: %s traced bytes, %+d since the first snapshot\n" % (
+                self.ticks, sum(stat.size for stat in snapshot.statistics('filename')),
+                sum(stat.size_diff for stat in snapshot.compare_to(self.baseline, 'filename'))))
+            for difference in snapshot.compare_to(self.baseline, 'lineno')[:5]:
+                key = str(difference.traceback)
+                if difference.size_diff > 0 and self.growing.get(key, 0) >= 3:
+                    self.out.write("  possible leak, grew %s intervals in a row: %s\n" % (self.growing[key], difference))
+        self.previous = snapshot
+
+    def report(self, out=None):
+        if out is None:
+            out = self.out
+        out.write("%s ticks, per tick:\n" % self.ticks)
+        out.write("%-20s %8s %10s %10s %10s %10s %8s %8s\n" % (
+            "phase", "calls", "bytes", "p99 bytes", "peak", "blocks", "gcs", "gc ms"))
+        for name in sorted(self.per_tick):
+            distributions = self.per_tick[name]
+            out.write("%-20s %8.1f %10.0f %10s %10.0f %10.1f %8.3f %8.3f\n" % (
+                name, distributions['calls'].mean(), distributions['bytes'].mean(),
+                distributions['bytes'].percentile(0.99), distributions['peak'].mean(),
+                distributions['blocks'].mean(), distributions['collections'].mean(),
+                distributions['gc_ms'].mean()))
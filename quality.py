@@ -0,0 +1,103 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Lowers the quality draw_world draws at when frames take too long to draw,
+# and raises it again once there's time to spare.
+
+import sys
+import time
+
+# each level leaves out what the ones before it do, and more
+QUALITY_FULL = 0
+# turret health and cooldown text isn't drawn
+QUALITY_NO_STATS = 1
+# the coverage layer is only redrawn every other tick
+QUALITY_STALE_COVERAGE = 2
+# objects jump to their new cells halfway through a tick instead of moving
+QUALITY_NO_INTERPOLATION = 3
+
+QUALITY_NAMES = ('full', 'no-stats', 'stale-coverage', 'no-interpolation')
+
+# frames a level is kept before it's lowered again, so the average can catch
+# up with what the last change did
+DEGRADE_FRAMES = 10
+
+# frames a level is kept before it's raised again; raising it too soon just
+# makes the quality flicker
+RECOVER_FRAMES = 120
+
+# quality is raised when frames take less than this much of the target
+HEADROOM = 0.5
+
+# weight of the newest frame in the average
+SMOOTHING = 0.1
+
+class QualityGovernor(object):
+    def __init__(self, target, level=QUALITY_FULL, adaptive=True):
+        # seconds a frame should take to draw
+        self.target = target
+        self.level = level
+        self.adaptive = adaptive
+        self.average = None
+        self.start = None
+        # frames since the level last changed
+        self.held = 0
+        self.changes = 0
+        # frames drawn at each level
+        self.frames = [0] * len(QUALITY_NAMES)
+
+    def get_level_name(self):
+        return QUALITY_NAMES[self.level]
+
+    def set_level(self, level):
+        if level != self.level:
+            self.level = level
+            self.held = 0
+            self.changes += 1
+
+    def started(self):
+        self.start = time.time()
+
+    def finished(self):
+        if self.start is None:
+            return
+        elapsed = time.time() - self.start
+        self.start = None
+
+        if self.average is None:
+            self.average = elapsed
+        else:
+            self.average += (elapsed - self.average) * SMOOTHING
+        self.frames[self.level] += 1
+        self.held += 1
+
+        if not self.adaptive:
+            return
+        if self.average > self.target:
+            if self.level < len(QUALITY_NAMES) - 1 and self.held >= DEGRADE_FRAMES:
+                self.set_level(self.level + 1)
+        elif self.average < self.target * HEADROOM:
+            if self.level > QUALITY_FULL and self.held >= RECOVER_FRAMES:
+                self.set_level(self.level - 1)
+
+    def report(self, out=sys.stdout):
+        total = sum(self.frames)
+        out.write("quality: now %s, changed %s times, target %.1fms\n" % (
+            self.get_level_name(), self.changes, self.target * 1000))
+        if self.average is not None:
+            out.write("  average frame: %.2fms\n" % (self.average * 1000))
+        for name, frames in zip(QUALITY_NAMES, self.frames):
+            if frames:
+                out.write("  %-18s %7s frames (%.1f%%)\n" % (name, frames, 100.0 * frames / total))
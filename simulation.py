@@ -0,0 +1,1181 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Game simulation. This module does not depend on pygame, so it can be used
+# by headless tools without initializing SDL.
+
+import random
+import collections
+
+class GameObject(object):
+    in_collision_check = False
+    
+    def collision_check(self, new_x, new_y, old_world, new_world):
+        obj = new_world.get_object(new_x, new_y)
+        if obj is not None and obj is not self:
+            return obj
+
+        obj = old_world.get_object(new_x, new_y)
+        if obj is not None and obj is not self and not old_world.is_destroyed(obj):
+            oth_x, oth_y = new_world.get_location(obj)
+            if oth_x == -1:
+                if self.in_collision_check:
+                    return True
+                else:
+                    self.in_collision_check = True
+                    obj.advance(old_world, new_world)
+                    self.in_collision_check = False
+                    oth_x, oth_y = new_world.get_location(obj)
+                    if (oth_x, oth_y) == (new_x, new_y):
+                        return True
+
+    def shoot(self, old_world, new_world):
+        pass
+
+    # rng is where random numbers come from, the random module or a
+    # random.Random
+    def get_initial_state(self, rng=random):
+        pass
+
+    # identifies what kind of object this is, for World.state_hash
+    def get_hash_key(self):
+        return (type(self).__name__,)
+
+class Baddie(GameObject):
+    # state -> ((x offset, y offset, new state), ...), in order of preference
+    preferred_offsets = {}
+
+    def collision_check(self, new_x, new_y, old_world, new_world):
+        result = GameObject.collision_check(self, new_x, new_y, old_world, new_world)
+        if result is not None:
+            return result
+
+        obj = old_world.get_object(new_x, new_y)
+        if obj is not None and obj is not self and isinstance(obj, Baddie) and not old_world.is_destroyed(obj):
+            old_x, old_y = old_world.get_location(self)
+            oth_x, oth_y = new_world.get_location(obj)
+            # compare as offsets from the other baddie's old location
+            base_x, base_y = old_world.get_location(obj)
+            old_x -= base_x
+            old_y -= base_y
+            oth_x -= base_x
+            oth_y -= base_y
+            for oth_pref_x, oth_pref_y, oth_pref_state in obj.get_preferred_offsets(old_world):
+                if oth_pref_x == old_x and oth_pref_y == old_y:
+                    return obj
+                elif oth_pref_x == oth_x and oth_pref_y == oth_y:
+                    break
+    
+    def advance(self, old_world, new_world):
+        old_x, old_y = old_world.get_location(self)
+
+        for xofs, yofs, new_state in self.get_preferred_offsets(old_world):
+            x, y = old_x + xofs, old_y + yofs
+            if not self.collision_check(x, y, old_world, new_world):
+                new_world.add_object(x, y, self, new_state)
+                break
+        else:
+            state = old_world.get_state(self, None)
+            new_world.add_object(old_x, old_y, self, state)
+
+    def get_preferred_offsets(self, world):
+        return self.preferred_offsets.get(world.get_state(self), ())
+
+    def get_preferred_locations(self, world):
+        old_x, old_y = world.get_location(self)
+
+        return [(old_x + xofs, old_y + yofs, new_state)
+                for xofs, yofs, new_state in self.get_preferred_offsets(world)]
+
+    def shoot(self, old_world, new_world):
+        target = None
+        target_health = 0
+        my_x, my_y = old_world.get_location(self)
+        for xofs, yofs in ((-1,0),(1,0),(0,-1),(0,1)):
+            obj = new_world.get_object(my_x + xofs, my_y + yofs)
+            if isinstance(obj, Turret):
+                cooldown, health = new_world.get_state(obj)
+                if target is None or health < target_health:
+                    target = obj
+                    target_health = health
+
+        if target is not None:
+            cooldown, health = new_world.get_state(target)
+            new_health = health - 4
+            x, y = new_world.get_location(target)
+            new_world.add_shot_animation(self, target)
+            if new_health <= 0:
+                new_world.destroy_object(target, self)
+            else:
+                new_world.add_object(x, y, target, (cooldown, new_health))
+
+# builds a preferred_offsets table for a baddie facing left (-1) or right (1)
+# from its (x offset, y offset, turn around) preferences when facing right
+def make_preferred_offsets(*offsets):
+    result = {}
+    for direction in (-1, 1):
+        result[direction] = tuple(
+            (xofs * direction, yofs, -direction if turn else direction)
+            for xofs, yofs, turn in offsets)
+    return result
+
+class MarchingBaddie(Baddie):
+    preferred_offsets = make_preferred_offsets(
+        (1, 0, False),
+        (0, 1, True),
+        (-1, 0, True),
+        (0, 0, True))
+
+    def get_initial_state(self, rng=random):
+        return rng.randint(0, 1) or -1
+
+class FallingBaddie(Baddie):
+    preferred_offsets = make_preferred_offsets(
+        (0, 1, False),
+        (1, 1, False),
+        (-1, 1, True),
+        (1, 0, False),
+        (-1, 0, True),
+        (0, 0, True))
+
+    def get_initial_state(self, rng=random):
+        return rng.randint(0, 1) or -1
+
+class Turret(GameObject):
+    cooldown = 1
+    starting_health = 4
+    
+    def advance(self, old_world, new_world):
+        old_x, old_y = old_world.get_location(self)
+
+        cooldown, health = old_world.get_state(self)
+
+        if cooldown > 0:
+            cooldown -= 1
+
+        new_world.add_object(old_x, old_y, self, (cooldown, health))
+
+    def shoot(self, old_world, new_world):
+        cooldown, health = new_world.get_state(self, (0, 12))
+        if cooldown:
+            return
+        
+        for x, y, in self.get_covered_locations(new_world):
+            obj = new_world.get_object(x, y)
+            if isinstance(obj, Baddie) and not new_world.is_destroyed(obj):
+                new_world.add_shot_animation(self, obj)
+                new_world.destroy_object(obj, self)
+
+                old_x, old_y = old_world.get_location(self)
+                cooldown = self.cooldown
+                health -= 1
+                if health <= 0:
+                    new_world.destroy_object(self)
+                else:
+                    new_world.add_object(old_x, old_y, self, (cooldown, health))
+                break
+
+    def get_covered_locations_at(self, world, x, y):
+        return ()
+
+    def get_covered_locations(self, world):
+        x, y = world.get_location(self)
+        return self.get_covered_locations_at(world, x, y)
+
+    def get_initial_state(self, rng=random):
+        return (1, self.starting_health)
+
+    def get_hash_key(self):
+        return (type(self).__name__, self.cooldown, self.starting_health)
+
+class DirectionalTurret(Turret):
+    direction = (0, -1)
+
+    def get_hash_key(self):
+        return (type(self).__name__, self.cooldown, self.starting_health, self.direction)
+
+    def get_covered_locations_at(self, world, x, y):
+        x_ofs, y_ofs = self.direction
+
+        while True:
+            x, y = x + x_ofs, y + y_ofs
+            obj = world.get_object(x, y)
+            if isinstance(obj, (OutOfBounds, Turret)):
+                break
+            yield x, y
+
+class KnightTurret(Turret):
+    def get_covered_locations_at(self, world, x, y):
+        for xofs, yofs in ((-1,2),(1,2),(-1,-2),(1,-2),(-2,1),(2,1),(-2,-1),(2,-1)):
+            obj = world.get_object(x + xofs, y + yofs)
+            if not isinstance(obj, (OutOfBounds, Turret)):
+                yield x + xofs, y + yofs
+
+class BishopTurret(Turret):
+    def get_covered_locations_at(self, world, x, y):
+        for x_ofs, y_ofs in ((-1,-1), (-1,1), (1,-1), (1,1)):
+            cx, cy = x, y
+            for i in range(2):
+                cx, cy = cx + x_ofs, cy + y_ofs
+                obj = world.get_object(cx, cy)
+                if isinstance(obj, (OutOfBounds, Turret)):
+                    break
+                yield cx, cy
+
+ACTION_NEWWORLD = "ACTION_NEWWORLD"
+ACTION_QUIT = "ACTION_QUIT"
+
+class Link(GameObject):
+    text = "text"
+    size = 1.0
+    action = None
+    action_args = ()
+
+    def advance(self, old_world, new_world):
+        old_x, old_y = old_world.get_location(self)
+
+        new_world.add_object(old_x, old_y, self, None)
+
+    def get_hash_key(self):
+        return (type(self).__name__, self.text)
+
+class OutOfBounds(object):
+    pass
+
+out_of_bounds = OutOfBounds()
+
+# Board masks for the combat phase are ints with one bit per cell, the bit for
+# (x, y) being x + y * (width + 2). The two unused bits at the end of each row
+# keep offsets of up to 2 cells from wrapping into the next row.
+
+def board_stride(width):
+    return width + 2
+
+def board_valid_mask(width, height):
+    row = (1 << width) - 1
+    stride = board_stride(width)
+    result = 0
+    for y in range(height):
+        result |= row << (y * stride)
+    return result
+
+# the cells whose cell at offset is set in mask
+def mask_at_offset(mask, offset, valid):
+    if offset >= 0:
+        return (mask >> offset) & valid
+    else:
+        return (mask << -offset) & valid
+
+# cells from which walking by offset reaches a target cell before a blocking
+# cell, counting the starting cell
+def mask_ray_reaches(targets, blocking, offset, valid):
+    result = targets
+    while True:
+        new_result = result | (mask_at_offset(result, offset, valid) & ~blocking)
+        if new_result == result:
+            return result
+        result = new_result
+
+KNIGHT_OFFSETS = ((-1,2),(1,2),(-1,-2),(1,-2),(-2,1),(2,1),(-2,-1),(2,-1))
+
+DIAGONAL_OFFSETS = ((-1,-1), (-1,1), (1,-1), (1,1))
+
+ADJACENT_OFFSETS = ((-1,0),(1,0),(0,-1),(0,1))
+
+MASK64 = (1 << 64) - 1
+
+# random 64-bit numbers for Zobrist hashing, generated on demand from the
+# feature they stand for so they are the same in every process
+zobrist_keys = {}
+
+def zobrist_key(feature):
+    result = zobrist_keys.get(feature)
+    if result is None:
+        result = random.Random(repr(feature)).getrandbits(64)
+        zobrist_keys[feature] = result
+    return result
+
+# splitmix64 finalizer, used to combine keys without making them linear
+def mix64(value):
+    value &= MASK64
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & MASK64
+    return value ^ (value >> 31)
+
+# memoizes World.advance for worlds that don't use random waves, for callers
+# that pass one to advance; it only pays where positions repeat, like the
+# title and help screens, and costs time and two world copies per miss
+# everywhere else
+class TranspositionCache(object):
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, world, shoot):
+        key = (world.state_hash(), shoot)
+        entry = self.entries.get(key)
+        if entry is not None:
+            source, result = entry
+            if world.same_state(source):
+                # most recently used entries go last
+                del self.entries[key]
+                self.entries[key] = entry
+                self.hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def put(self, world, shoot, result):
+        key = (world.state_hash(), shoot)
+        if key in self.entries:
+            del self.entries[key]
+        elif len(self.entries) >= self.size:
+            self.entries.popitem(last=False)
+        self.entries[key] = (world.copy(), result.copy())
+
+    def clear(self):
+        self.entries.clear()
+
+class World(object):
+    # where the world's random numbers come from; a game with a random.Random
+    # of its own plays the same whatever else uses the random module, and the
+    # worlds advanced from it share it
+    rng = random
+
+    def __init__(self, width, height, rng=None):
+        if rng is not None and rng is not random:
+            self.rng = rng
+
+        self.width = width
+        self.height = height
+
+        self.objects = [None] * (width * height)
+
+        # the Zobrist key of each cell, and the xor of all of them; cells that
+        # changed are only rehashed when the hash is needed
+        self.cell_keys = [0] * (width * height)
+
+        self.grid_hash = 0
+
+        self.dirty_cells = []
+
+        self.object_to_pos = {}
+
+        self.object_state = {}
+
+        self.destroyed_objects = {}
+
+        self.mouse_pos = (-1, -1)
+
+        self.place_turret_cooldown = 3
+
+        self.place_turret_points = 0
+
+        self.shot_animations = []
+
+        self.turret_health_multiplier = 4
+
+        # smallest and largest number of baddies in a random wave
+        self.wave_size_range = (3, 12)
+
+        self.next_turret = self.get_random_turret()
+
+        self.waves = []
+
+        self.lost = False
+
+        self.score = 0
+
+        self.click_to_baddie = False
+
+        self.num_waves = 0
+
+        self.game_ui = True
+        
+        self.realtime = False
+
+        self.help_text = ""
+
+        self.help_text_on_top = False
+
+        # counts changes made to this world after it was made, by clicks, so
+        # anything cached for it can tell it's out of date
+        self.changes = 0
+
+    def add_object(self, x, y, obj, state=None):
+        index = x + y * self.width
+
+        self.objects[index] = obj
+
+        # the object's old cell may still hold it, with a different state now
+        old_pos = self.object_to_pos.get(obj)
+        if old_pos is not None:
+            self.dirty_cells.append(old_pos[0] + old_pos[1] * self.width)
+
+        self.object_to_pos[obj] = (x, y)
+
+        if state is None:
+            state = obj.get_initial_state(self.rng)
+
+        self.object_state[obj] = state
+
+        self.dirty_cells.append(index)
+
+    def update_cell_key(self, index):
+        obj = self.objects[index]
+        if obj is None:
+            key = 0
+        else:
+            key = zobrist_key((obj.get_hash_key(), self.object_state.get(obj), obj in self.destroyed_objects))
+            key = mix64(key + index * 0x9e3779b97f4a7c15)
+        self.grid_hash ^= self.cell_keys[index] ^ key
+        self.cell_keys[index] = key
+
+    # covers the grid, object states, waves and next turret, but not the
+    # counters (score and place_turret_points) or the mouse position, so
+    # repeating positions hash the same
+    def get_grid_hash(self):
+        if self.dirty_cells:
+            for index in self.dirty_cells:
+                self.update_cell_key(index)
+            self.dirty_cells = []
+        return self.grid_hash
+
+    def state_hash(self):
+        result = self.get_grid_hash()
+        for count, enemy_type, enemy_initial_state, spawnx in self.waves:
+            result = mix64(result ^ zobrist_key(('wave', count, enemy_type.__name__, enemy_initial_state, spawnx)))
+        for value in (self.width, self.height, self.num_waves, self.place_turret_cooldown, self.lost, self.click_to_baddie, self.realtime,
+                      self.turret_health_multiplier, zobrist_key(self.wave_size_range), zobrist_key(self.next_turret.get_hash_key())):
+            result = mix64(result ^ value)
+        return result
+
+    # whether the worlds would advance the same way, comparing object identity
+    def same_state(self, other):
+        return (self.width == other.width and
+                self.height == other.height and
+                self.objects == other.objects and
+                self.object_state == other.object_state and
+                self.destroyed_objects == other.destroyed_objects and
+                self.waves == other.waves and
+                self.num_waves == other.num_waves and
+                self.place_turret_cooldown == other.place_turret_cooldown and
+                self.lost == other.lost and
+                self.click_to_baddie == other.click_to_baddie and
+                self.realtime == other.realtime and
+                self.turret_health_multiplier == other.turret_health_multiplier and
+                self.wave_size_range == other.wave_size_range and
+                self.next_turret is other.next_turret and
+                self.game_ui == other.game_ui and
+                self.help_text == other.help_text and
+                self.help_text_on_top == other.help_text_on_top)
+
+    # copies everything but the objects themselves, without using random
+    def copy(self):
+        result = World.__new__(World)
+        result.copy_from(self)
+        return result
+
+    def copy_from(self, other):
+        self.__dict__.update(other.__dict__)
+        self.objects = list(other.objects)
+        self.cell_keys = list(other.cell_keys)
+        self.dirty_cells = list(other.dirty_cells)
+        self.object_to_pos = dict(other.object_to_pos)
+        self.object_state = dict(other.object_state)
+        self.destroyed_objects = dict(other.destroyed_objects)
+        self.shot_animations = list(other.shot_animations)
+        self.waves = list(other.waves)
+
+    def get_object(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.objects[x + y * self.width]
+
+        return out_of_bounds
+
+    def get_location(self, obj):
+        return self.object_to_pos.get(obj, (-1, -1))
+
+    def get_state(self, obj, default = None):
+        return self.object_state.get(obj, default)
+
+    def destroy_object(self, obj, destroyed_by=None):
+        self.destroyed_objects[obj] = destroyed_by
+
+        pos = self.object_to_pos.get(obj)
+        if pos is not None:
+            self.dirty_cells.append(pos[0] + pos[1] * self.width)
+
+    def is_destroyed(self, obj):
+        return obj in self.destroyed_objects
+
+    def destroyer(self, obj):
+        return self.destroyed_objects.get(obj, None)
+
+    def make_random_wave(self):
+        count = self.rng.randint(*self.wave_size_range)
+        enemy_type = MarchingBaddie
+        enemy_initial_state = enemy_type().get_initial_state(self.rng)
+        spawnx = self.rng.randint(0,self.width-1)
+        return count, enemy_type, enemy_initial_state, spawnx
+
+    def advance(self, shoot=True, cache=None):
+        # without waves, the only random numbers used are the ones World()
+        # uses for next_turret, so a memoized result can be reused
+        if cache is not None and self.num_waves == 0 and not self.waves:
+            cached = cache.get(self, shoot)
+            if cached is not None:
+                result = World(self.width, self.height, self.rng)
+                rng = result.__dict__.get('rng')
+                result.copy_from(cached)
+                # the cached world may be from a game with another rng
+                if rng is None:
+                    result.__dict__.pop('rng', None)
+                else:
+                    result.rng = rng
+                result.mouse_pos = self.mouse_pos
+                result.place_turret_points = self.place_turret_points + 1
+                if result.lost:
+                    result.score = self.score
+                else:
+                    result.score = self.score + 1
+                return result
+
+            result = self.advance_uncached(shoot)
+            cache.put(self, shoot, result)
+            return result
+
+        return self.advance_uncached(shoot)
+
+    def advance_uncached(self, shoot=True, masked_combat=True):
+        result = self.make_next_world()
+
+        self.spawn_waves(result)
+
+        self.move_objects(result)
+
+        if shoot:
+            if masked_combat:
+                self.shoot_objects_masked(result)
+            else:
+                self.shoot_objects(result)
+
+        self.finish_tick(result)
+
+        return result
+
+    # the phases of advance_uncached, separate so they can be profiled
+
+    def make_next_world(self):
+        result = World(self.width, self.height, self.rng)
+
+        result.lost = self.lost
+
+        result.click_to_baddie = self.click_to_baddie
+
+        result.num_waves = self.num_waves
+
+        result.game_ui = self.game_ui
+
+        result.turret_health_multiplier = self.turret_health_multiplier
+
+        result.wave_size_range = self.wave_size_range
+
+        result.realtime = self.realtime
+
+        result.help_text = self.help_text
+
+        result.help_text_on_top = self.help_text_on_top
+
+        return result
+
+    def spawn_waves(self, result):
+        while len(self.waves) < self.num_waves:
+            self.waves.append(self.make_random_wave())
+
+        for count, enemy_type, enemy_initial_state, spawnx in self.waves:
+            enemy = enemy_type()
+            result.add_object(spawnx, 0, enemy, enemy_initial_state)
+            if count > 1:
+                result.waves.append((count-1, enemy_type, enemy_initial_state, spawnx))
+
+    def move_objects(self, result):
+        for x in range(self.width):
+            for y in range(self.height-1, -1, -1):
+                obj = self.get_object(x, y)
+                if obj is not None and not self.is_destroyed(obj) and result.get_location(obj) == (-1,-1):
+                    obj.advance(self, result)
+
+    def shoot_objects(self, result):
+        for x in range(self.width):
+            for y in range(self.height-1, -1, -1):
+                obj = self.get_object(x, y)
+                if obj is not None and not self.is_destroyed(obj):
+                    obj.shoot(self, result)
+
+    # does the same as shoot_objects, but only calls shoot() on the objects
+    # that can hit something, found with board masks of the new world
+    #
+    # This is exact because nothing a shot changes can give another object
+    # something to shoot at: turrets stay in their cells when destroyed,
+    # baddies only get destroyed, and only a turret's own shot changes its
+    # cooldown.
+    def shoot_objects_masked(self, result):
+        width = self.width
+        stride = board_stride(width)
+        valid = board_valid_mask(width, self.height)
+
+        turrets = 0
+        live_baddies = 0
+        for index, obj in enumerate(result.objects):
+            if obj is None:
+                continue
+            if isinstance(obj, Turret):
+                turrets |= 1 << (index % width + index // width * stride)
+            elif isinstance(obj, Baddie) and obj not in result.destroyed_objects:
+                live_baddies |= 1 << (index % width + index // width * stride)
+
+        # baddies shoot from their old cells at neighboring turrets
+        turret_neighbors = 0
+        for xofs, yofs in ADJACENT_OFFSETS:
+            turret_neighbors |= mask_at_offset(turrets, xofs + yofs * stride, valid)
+
+        # cells each kind of turret would see a live baddie from, made as needed
+        sees_baddie = {}
+
+        def get_sees_baddie(obj):
+            if isinstance(obj, DirectionalTurret):
+                key = obj.direction
+                if key not in sees_baddie:
+                    offset = obj.direction[0] + obj.direction[1] * stride
+                    reaches = mask_ray_reaches(live_baddies, turrets, offset, valid)
+                    sees_baddie[key] = mask_at_offset(reaches, offset, valid)
+            elif isinstance(obj, KnightTurret):
+                key = KnightTurret
+                if key not in sees_baddie:
+                    mask = 0
+                    for xofs, yofs in KNIGHT_OFFSETS:
+                        mask |= mask_at_offset(live_baddies, xofs + yofs * stride, valid)
+                    sees_baddie[key] = mask
+            else:
+                key = BishopTurret
+                if key not in sees_baddie:
+                    mask = 0
+                    open_cells = valid & ~turrets
+                    for xofs, yofs in DIAGONAL_OFFSETS:
+                        offset = xofs + yofs * stride
+                        mask |= mask_at_offset(live_baddies, offset, valid)
+                        mask |= mask_at_offset(open_cells, offset, valid) & mask_at_offset(live_baddies, offset * 2, valid)
+                    sees_baddie[key] = mask
+            return sees_baddie[key]
+
+        shooters = []
+        for index, obj in enumerate(self.objects):
+            if obj is None or obj in self.destroyed_objects:
+                continue
+            cls = type(obj)
+            if isinstance(obj, Baddie) and cls.shoot == Baddie.shoot:
+                x, y = self.get_location(obj)
+                if not (turret_neighbors >> (x + y * stride)) & 1:
+                    continue
+            elif cls in (DirectionalTurret, KnightTurret, BishopTurret):
+                cooldown, health = result.get_state(obj, (0, 12))
+                if cooldown:
+                    continue
+                x, y = result.get_location(obj)
+                if not (get_sees_baddie(obj) >> (x + y * stride)) & 1:
+                    continue
+            elif cls.shoot == GameObject.shoot:
+                continue
+            shooters.append((index % width, -(index // width), obj))
+
+        # in the same order as shoot_objects
+        shooters.sort(key=lambda shooter: shooter[:2])
+        for x, y, obj in shooters:
+            obj.shoot(self, result)
+
+    def finish_tick(self, result):
+        for x in range(self.width):
+            if not isinstance(result.get_object(x, self.height-1), Baddie):
+                break
+        else:
+            result.lost = True
+
+        if result.lost:
+            result.score = self.score
+        else:
+            result.score = self.score + 1
+
+        result.mouse_pos = self.mouse_pos
+
+        result.place_turret_cooldown = self.place_turret_cooldown
+        result.place_turret_points = self.place_turret_points + 1
+        
+        result.next_turret = self.next_turret
+
+    def clicked(self, x, y):
+        obj = self.get_object(x, y)
+        if isinstance(obj, Link):
+            return obj
+        if self.click_to_baddie:
+            count, enemy_type, enemy_initial_state, spawnx = self.make_random_wave()
+            self.add_object(x, y, enemy_type(), enemy_initial_state)
+            self.changes += 1
+            return True
+        else:
+            if self.place_turret_cooldown <= self.place_turret_points and y != 0:
+                self.add_object(x, y, self.next_turret)
+                self.place_turret_points -= self.place_turret_cooldown
+                self.next_turret = self.get_random_turret()
+                self.changes += 1
+                return True
+
+    def hover(self, x, y):
+        self.mouse_pos = (x, y)
+
+    def add_shot_animation(self, source, target):
+        self.shot_animations.append((source, target))
+
+    def get_random_turret(self):
+        r = self.rng.randint(0,5)
+        if r < 4:
+            result = DirectionalTurret()
+            result.direction = ((-1,0),(1,0),(0,-1),(0,1))[r]
+            if r == 3:
+                result.starting_health = 9 * self.turret_health_multiplier
+                result.cooldown = 1
+            else:
+                result.starting_health = self.turret_health_multiplier
+            return result
+        elif r == 4:
+            result = KnightTurret()
+            result.starting_health = self.turret_health_multiplier
+            return result
+        elif r == 5:
+            result = BishopTurret()
+            result.starting_health = self.turret_health_multiplier
+            return result
+
+def make_hard_game(width, height):
+    world = World(width, height)
+    world.num_waves = 1
+    world.place_turret_cooldown = 4
+
+    return world
+
+def make_insane_game(width, height):
+    world = World(width, height)
+    world.turret_health_multiplier = 6
+    world.place_turret_cooldown = 8
+    world.num_waves = 1
+    world.next_turret = world.get_random_turret() #FIXME
+    world.realtime = True
+
+    return world
+
+def make_normal_game(width, height):
+    world = World(width, height)
+    world.num_waves = 1
+
+    return world
+
+def make_easy_game(width, height):
+    world = World(width, height)
+    world.turret_health_multiplier = 5
+    world.num_waves = 1
+    world.next_turret = world.get_random_turret() #FIXME
+
+    return world
+
+def make_help_world1(width, height):
+    world = World(width, height)
+    world.place_turret_cooldown = 1
+    world.game_ui = False
+
+    world.help_text = """
+Click to place a turret.
+
+The red x's show where the new
+turret will be able to fire.
+
+Every few turns, a new turret
+can be placed.
+
+The types of new turrets are
+chosen randomly.
+
+Squares covered by turrets
+are brightened."""
+
+    link = Link()
+    link.text = "Title"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_title_world
+    world.add_object(0, 7, link)
+
+    link = Link()
+    link.text = "" # Prev
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world1
+    world.add_object(1, 7, link)
+
+    link = Link()
+    link.text = "Page\n1 of 5"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world1
+    world.add_object(2, 7, link)
+
+    link = Link()
+    link.text = "Next"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world2
+    world.add_object(3, 7, link)
+
+    link = Link()
+    link.text = ""
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world1
+    world.add_object(4, 7, link)
+
+    link = Link()
+    link.text = "Reset"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world1
+    world.add_object(5, 7, link)
+
+    return world
+
+def make_help_world2(width, height):
+    world = World(width, height)
+    world.click_to_baddie = True
+    world.game_ui = False
+
+    world.help_text = """
+Click to place an enemy.
+
+Pay attention to how they move.
+
+Enemies will always move in the
+direction they face when possible.
+
+Otherwise, they will turn around,
+and attempt to move down.
+
+Failing that, they will try to move
+to the new direction they face.
+
+Predicting where enemies will go
+is very important."""
+
+    link = Link()
+    link.text = "Title"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_title_world
+    world.add_object(0, 7, link)
+
+    link = Link()
+    link.text = "Prev"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world1
+    world.add_object(1, 7, link)
+
+    link = Link()
+    link.text = "Page\n2 of 5"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world2
+    world.add_object(2, 7, link)
+
+    link = Link()
+    link.text = "Next"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world3
+    world.add_object(3, 7, link)
+
+    link = Link()
+    link.text = ""
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world2
+    world.add_object(4, 7, link)
+
+    link = Link()
+    link.text = "Reset"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world2
+    world.add_object(5, 7, link)
+
+    return world
+
+def make_help_world3(width, height):
+    world = World(width, height)
+    world.click_to_baddie = True
+    world.game_ui = False
+    world.num_waves = 1
+    world.help_text_on_top = True
+
+    world.help_text = """
+Enemies appear constantly at the
+top of the screen.
+
+When the bottom row is filled
+with enemies, the game is lost.
+
+The goal is to survive as long
+as possible."""
+
+    link = Link()
+    link.text = "Title"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_title_world
+    world.add_object(0, 7, link)
+
+    link = Link()
+    link.text = "Prev"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world2
+    world.add_object(1, 7, link)
+
+    link = Link()
+    link.text = "Page\n3 of 5"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world3
+    world.add_object(2, 7, link)
+
+    link = Link()
+    link.text = "Next"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world4
+    world.add_object(3, 7, link)
+
+    link = Link()
+    link.text = ""
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world3
+    world.add_object(4, 7, link)
+
+    link = Link()
+    link.text = "Reset"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world3
+    world.add_object(5, 7, link)
+
+    return world
+
+def make_help_world4(width, height):
+    world = World(width, height)
+    world.place_turret_cooldown = 10000
+    world.place_turret_points = 10000
+    world.game_ui = False
+    world.next_turret = DirectionalTurret()
+
+    world.help_text = """
+Enemies move, but turrets do not.
+
+It takes a single turn to fire.
+
+That means that a turret can hit
+an enemy only if the enemy WILL
+BE in the turret's range next turn.
+
+Enemies will attack your turrets
+when they are directly adjacent."""
+
+    link = Link()
+    link.text = "Title"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_title_world
+    world.add_object(0, 7, link)
+
+    link = Link()
+    link.text = "Prev"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world3
+    world.add_object(1, 7, link)
+
+    link = Link()
+    link.text = "Page\n4 of 5"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world4
+    world.add_object(2, 7, link)
+
+    link = Link()
+    link.text = "Next"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world5
+    world.add_object(3, 7, link)
+
+    link = Link()
+    link.text = ""
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world4
+    world.add_object(4, 7, link)
+
+    link = Link()
+    link.text = "Reset"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world4
+    world.add_object(5, 7, link)
+
+    world.add_object(3, 5, MarchingBaddie(), -1)
+    world.add_object(4, 4, MarchingBaddie(), -1)
+
+    return world
+
+def make_help_world5(width, height):
+    world = World(width, height)
+    world.place_turret_cooldown = 0
+    world.place_turret_points = 0
+    world.realtime = True
+    world.game_ui = False
+    world.num_waves = 1
+    world.help_text_on_top = True
+
+    world.help_text = """
+Firing at an enemy will deplete
+1 health from the turret.
+
+If a turret is attacked, it will
+lose 4 health.
+
+Placing a turret directly on
+another object will kill it."""
+
+    link = Link()
+    link.text = "Title"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_title_world
+    world.add_object(0, 7, link)
+
+    link = Link()
+    link.text = "Prev"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world4
+    world.add_object(1, 7, link)
+
+    link = Link()
+    link.text = "Page\n5 of 5"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world5
+    world.add_object(2, 7, link)
+
+    link = Link()
+    link.text = "" # Next
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world5
+    world.add_object(3, 7, link)
+
+    link = Link()
+    link.text = ""
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world5
+    world.add_object(4, 7, link)
+
+    link = Link()
+    link.text = "Reset"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world5
+    world.add_object(5, 7, link)
+
+    return world
+
+def make_title_world(width, height):
+    world = World(width, height)
+    world.num_waves = 0 # don't spawn enemies
+    world.click_to_baddie = True
+    world.game_ui = False
+
+    link = Link()
+    link.text = "Easy\nGame"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_easy_game
+    world.add_object(1, 3, link)
+
+    link = Link()
+    link.text = "Normal\nGame"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_normal_game
+    world.add_object(2, 4, link)
+
+    link = Link()
+    link.text = "Hard\nGame"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_hard_game
+    world.add_object(3, 3, link)
+
+    link = Link()
+    link.text = "Insane\nGame"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_insane_game
+    world.add_object(4, 4, link)
+
+    x = 0
+    for char in "Chary":
+        link = Link()
+        link.text = char
+        link.size = 1.0
+        link.action = ACTION_NEWWORLD
+        link.action_args = make_title_world
+        world.add_object(x, 1, link)
+        x += 1
+
+    link = Link()
+    link.text = "Help"
+    link.size = 0.35
+    link.action = ACTION_NEWWORLD
+    link.action_args = make_help_world1
+    world.add_object(1, 6, link)
+
+    link = Link()
+    link.text = "Quit"
+    link.size = 0.35
+    link.action = ACTION_QUIT
+    world.add_object(3, 6, link)
+
+    return world
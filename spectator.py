@@ -0,0 +1,198 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Shows a grid of bot-played games in one window. The games run in worker
+# processes, which send each tick's pair of worlds. A cell is only redrawn
+# when its game ticks, and only the redrawn cells are updated on the screen.
+# Cells are all the same size, so they share draw_world's sprite cache.
+
+import sys
+import time
+import pickle
+import random
+import argparse
+import multiprocessing
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import pygame
+from pygame.locals import *
+
+from simulation import *
+from tower import draw_world, draw_text
+from headless import presets, policies, wants_placement
+
+# ticks shown after a game is lost, before it restarts
+GAME_OVER_TICKS = 10
+
+# cells are drawn halfway through a tick, so shots and destroyed objects show
+CELL_T = 0.5
+
+# seconds of each frame to spend redrawing cells; cells that don't fit wait
+# for the next frame, so games ticking together don't make a slow frame
+FRAME_BUDGET = 0.008
+
+def worker(results, first_game, games, preset, policy_name, width, height, tick_rate, seed):
+    random.seed(seed + first_game)
+    policy = policies[policy_name]()
+    worlds = [presets[preset](width, height) for i in range(games)]
+    game_over = [0] * games
+
+    next_tick = time.time()
+    while True:
+        deciding = [i for i in range(games) if wants_placement(worlds[i])]
+        if deciding:
+            cells = policy.choose_batch([worlds[i] for i in deciding])
+            for i, cell in zip(deciding, cells):
+                if cell is not None:
+                    worlds[i].clicked(cell[0], cell[1])
+
+        ticks = []
+        for i in range(games):
+            old_world = worlds[i]
+            if old_world.lost:
+                game_over[i] += 1
+                if game_over[i] < GAME_OVER_TICKS:
+                    continue
+                game_over[i] = 0
+                old_world = presets[preset](width, height)
+            world = worlds[i] = old_world.advance()
+            # pickled together, so objects are shared between the two worlds
+            ticks.append((first_game + i, pickle.dumps((old_world, world), pickle.HIGHEST_PROTOCOL)))
+        results.put(ticks)
+
+        if tick_rate:
+            next_tick += 1.0 / tick_rate
+            delay = next_tick - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.time()
+
+class SpectatorGrid(object):
+    def __init__(self, games, columns, cell_width, cell_height, border=2):
+        self.games = games
+        self.columns = columns
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.border = border
+        self.scores = [0] * games
+        self.ticks = 0
+
+    def get_rect(self, game):
+        row, column = divmod(game, self.columns)
+        return Rect(column * self.cell_width, row * self.cell_height, self.cell_width, self.cell_height)
+
+    # draws the latest tick of games in pending into their cells, removing
+    # them from pending, until the time budget runs out; returns the rects
+    # that changed
+    def draw(self, surface, pending, budget=FRAME_BUDGET):
+        dirty = []
+        deadline = time.time() + budget
+        # games that have waited longest go first
+        for game in sorted(pending, key=lambda game: pending[game][0]):
+            if dirty and time.time() > deadline:
+                break
+            received, data = pending.pop(game)
+            old_world, world = pickle.loads(data)
+            rect = self.get_rect(game)
+            cell = surface.subsurface(rect)
+            cell.fill(Color(0,0,32,255))
+            draw_world(old_world, world, CELL_T, cell, 0, 0,
+                       rect.width - self.border, rect.height - self.border)
+            if world.lost:
+                draw_text(cell, "Game Over %s" % world.score, 0, 0, max(12, rect.height // 8))
+            self.scores[game] = world.score
+            dirty.append(rect)
+        self.ticks += len(dirty)
+        return dirty
+
+def run(grid, results):
+    screen = pygame.display.get_surface()
+    screen.fill(Color(0,0,32,255))
+    pygame.display.flip()
+    clock = pygame.time.Clock()
+    # game -> (time first received, newest tick)
+    pending = {}
+
+    while True:
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                return
+            elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                return
+
+        # only the newest tick of each game is worth drawing
+        while True:
+            try:
+                ticks = results.get_nowait()
+            except queue.Empty:
+                break
+            for game, data in ticks:
+                received = pending[game][0] if game in pending else time.time()
+                pending[game] = (received, data)
+
+        if pending:
+            pygame.display.update(grid.draw(screen, pending))
+
+        clock.tick(60)
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch many bot-played games at once.")
+    parser.add_argument("--games", type=int, default=64)
+    parser.add_argument("--columns", type=int)
+    parser.add_argument("--cell-width", type=int, default=96)
+    parser.add_argument("--width", type=int, default=6)
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument("--preset", default="normal", choices=sorted(presets))
+    parser.add_argument("--policy", default="coverage", choices=sorted(policies))
+    parser.add_argument("--tick-rate", type=float, default=3.0, help="ticks per second of each game, 0 for unlimited")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    columns = args.columns or max(1, int(args.games ** 0.5 * args.height / args.width + 0.5))
+    rows = (args.games + columns - 1) // columns
+    cell_width = args.cell_width
+    cell_height = cell_width * args.height // args.width
+
+    processes = min(args.games, args.processes or multiprocessing.cpu_count())
+    results = multiprocessing.Queue()
+    workers = []
+    first_game = 0
+    for i in range(processes):
+        games = (args.games - first_game) // (processes - i)
+        process = multiprocessing.Process(target=worker, args=(results, first_game, games,
+            args.preset, args.policy, args.width, args.height, args.tick_rate, args.seed))
+        process.daemon = True
+        process.start()
+        workers.append(process)
+        first_game += games
+
+    pygame.init()
+    pygame.display.set_mode((columns * cell_width, rows * cell_height))
+    pygame.display.set_caption("Chary - %s games" % args.games)
+
+    grid = SpectatorGrid(args.games, columns, cell_width, cell_height)
+    run(grid, results)
+
+    for process in workers:
+        process.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Advances the world on a background thread while the current tick is drawn,
+# so the tick boundary doesn't have to.
+
+import threading
+
+from simulation import *
+
+class NextTickSpeculator(object):
+    # when not enabled, every advance happens on the calling thread; cache
+    # is a TranspositionCache for every advance to use, or None
+    def __init__(self, enabled=True, cache=None):
+        self.enabled = enabled
+        self.cache = cache
+
+        # objects keep temporary state during World.advance, so only one
+        # advance may run at a time, on any thread
+        self.advance_lock = threading.Lock()
+
+        self.condition = threading.Condition()
+        # bumped whenever the pending world is replaced or invalidated
+        self.generation = 0
+        self.world = None
+        self.source = None
+        self.result = None
+
+        self.hits = 0
+        self.misses = 0
+
+        if enabled:
+            self.thread = threading.Thread(target=self.worker)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def worker(self):
+        while True:
+            with self.condition:
+                while self.source is None or self.result is not None:
+                    self.condition.wait()
+                generation = self.generation
+                source = self.source
+
+            with self.advance_lock:
+                result = source.advance(cache=self.cache)
+
+            with self.condition:
+                if generation == self.generation:
+                    self.result = result
+                self.condition.notify_all()
+
+    # starts computing world.advance(); world may still be hovered over, but
+    # anything else that changes it must call start() or invalidate() again
+    def start(self, world):
+        if not self.enabled:
+            return
+        with self.condition:
+            self.generation += 1
+            self.world = world
+            # advance appends to waves, so work on a copy
+            self.source = world.copy()
+            self.result = None
+            self.condition.notify_all()
+
+    def invalidate(self):
+        with self.condition:
+            self.generation += 1
+            self.world = self.source = self.result = None
+            self.condition.notify_all()
+
+    # returns world.advance(shoot), using the speculative result if it is for
+    # this world
+    def advance(self, world, shoot=True):
+        if shoot:
+            with self.condition:
+                if self.world is world:
+                    generation = self.generation
+                    while self.result is None and self.generation == generation:
+                        self.condition.wait()
+                    if self.generation == generation:
+                        result = self.result
+                        world.waves = self.source.waves
+                        self.world = self.source = self.result = None
+                        self.generation += 1
+                        self.hits += 1
+                        result.mouse_pos = world.mouse_pos
+                        return result
+                self.misses += 1
+
+        with self.advance_lock:
+            return world.advance(shoot, self.cache)
@@ -0,0 +1,287 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Columnar result files for large numbers of headless games.
+#
+# A file starts with a header naming its columns and their array typecodes,
+# followed by batches. Each batch is a row count and then, for each column,
+# that many little-endian values. Writers buffer one batch at a time and
+# readers only load one batch at a time, so neither grows with the file.
+
+import sys
+import math
+import array
+import struct
+import argparse
+
+MAGIC = b"TOWERCOL"
+VERSION = 1
+
+BATCH_SIZE = 4096
+
+# integers closer to zero than this are counted exactly, as are fractions of
+# 1/EXACT_LIMIT below 1; anything larger goes in bins BIN_GROWTH times wider
+# than the one before, so a column takes a bounded number of bins whatever
+# its values, and a percentile is within 1% of a value that was added
+EXACT_LIMIT = 1024
+BIN_GROWTH = 1.02
+LOG_BIN_GROWTH = math.log(BIN_GROWTH)
+
+# columns that identify a row rather than measure anything, left out of a
+# summary unless asked for
+ID_COLUMNS = ('game', 'seed')
+
+def write_header(f, columns):
+    f.write(MAGIC)
+    f.write(struct.pack('<HH', VERSION, len(columns)))
+    for name, typecode in columns:
+        name = name.encode('ascii')
+        f.write(struct.pack('<B', len(name)))
+        f.write(name)
+        f.write(typecode.encode('ascii'))
+
+def read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a column file")
+    version, count = struct.unpack('<HH', f.read(4))
+    if version != VERSION:
+        raise ValueError("unsupported column file version %s" % version)
+    columns = []
+    for i in range(count):
+        length, = struct.unpack('<B', f.read(1))
+        name = f.read(length).decode('ascii')
+        typecode = f.read(1).decode('ascii')
+        columns.append((name, typecode))
+    return columns
+
+class ColumnWriter(object):
+    def __init__(self, path, columns, batch_size=BATCH_SIZE):
+        self.columns = list(columns)
+        self.names = [name for name, typecode in self.columns]
+        self.batch_size = batch_size
+        self.rows = 0
+
+        self.f = open(path, 'a+b')
+        self.f.seek(0, 2)
+        if self.f.tell() == 0:
+            write_header(self.f, self.columns)
+        else:
+            self.f.seek(0)
+            if read_header(self.f) != self.columns:
+                self.f.close()
+                raise ValueError("%s has different columns" % path)
+            self.f.seek(0, 2)
+
+        self.new_batch()
+
+    def new_batch(self):
+        self.arrays = [array.array(typecode) for name, typecode in self.columns]
+
+    def append(self, record):
+        if isinstance(record, dict):
+            record = [record[name] for name in self.names]
+        for values, value in zip(self.arrays, record):
+            values.append(value)
+        self.rows += 1
+        if self.rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.f.write(struct.pack('<I', self.rows))
+        for values in self.arrays:
+            if sys.byteorder != 'little':
+                values.byteswap()
+            if hasattr(values, 'tobytes'):
+                self.f.write(values.tobytes())
+            else:
+                self.f.write(values.tostring())
+        self.f.flush()
+        self.rows = 0
+        self.new_batch()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# yields (columns, {name: array}) for each batch in a file
+def read_batches(path):
+    f = open(path, 'rb')
+    try:
+        columns = read_header(f)
+        while True:
+            data = f.read(4)
+            if len(data) < 4:
+                break
+            rows, = struct.unpack('<I', data)
+            batch = {}
+            for name, typecode in columns:
+                values = array.array(typecode)
+                data = f.read(rows * values.itemsize)
+                if len(data) < rows * values.itemsize:
+                    # a batch cut short by a worker that was killed
+                    return
+                if hasattr(values, 'frombytes'):
+                    values.frombytes(data)
+                else:
+                    values.fromstring(data)
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                batch[name] = values
+            yield columns, batch
+    finally:
+        f.close()
+
+# running summary of one column, counted in bins of bin_width or, by default,
+# the bounded bins described at EXACT_LIMIT
+class Distribution(object):
+    def __init__(self, bin_width=None):
+        self.bin_width = bin_width
+        self.integral = True
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.counts = {}
+
+    def add_values(self, values):
+        if not len(values):
+            return
+        self.count += len(values)
+        self.total += sum(values)
+        self.total_squares += sum(float(value) * value for value in values)
+        low = min(values)
+        high = max(values)
+        if self.minimum is None or low < self.minimum:
+            self.minimum = low
+        if self.maximum is None or high > self.maximum:
+            self.maximum = high
+        if isinstance(values[0], float):
+            self.integral = False
+        counts = self.counts
+        if self.bin_width is None:
+            for value in values:
+                key = get_bin(value)
+                counts[key] = counts.get(key, 0) + 1
+        else:
+            for value in values:
+                key = math.floor(value / self.bin_width) * self.bin_width
+                counts[key] = counts.get(key, 0) + 1
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def stddev(self):
+        if self.count < 2:
+            return 0.0
+        mean = self.mean()
+        return math.sqrt(max(0.0, self.total_squares / self.count - mean * mean))
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        target = fraction * (self.count - 1)
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen > target:
+                # a bin's middle may be past the values that went in it
+                value = min(max(value, self.minimum), self.maximum)
+                if self.integral:
+                    value = int(round(value))
+                return value
+        return self.maximum
+
+# the value standing for the default bin a value is counted in
+def get_bin(value):
+    magnitude = abs(value)
+    if magnitude < EXACT_LIMIT and magnitude == int(magnitude):
+        return value
+    if magnitude < 1:
+        return math.floor(value * EXACT_LIMIT) / float(EXACT_LIMIT)
+    index = math.floor(math.log(magnitude) / LOG_BIN_GROWTH)
+    middle = math.exp((index + 0.5) * LOG_BIN_GROWTH)
+    if value < 0:
+        return -middle
+    return middle
+
+class Aggregator(object):
+    # columns, if given, are the ones to summarize; otherwise all but the
+    # ID_COLUMNS are
+    def __init__(self, columns=None, bin_widths=None):
+        self.columns = columns
+        self.bin_widths = bin_widths or {}
+        self.distributions = {}
+        self.rows = 0
+
+    def add_file(self, path):
+        for columns, batch in read_batches(path):
+            for name, typecode in columns:
+                if self.columns is None:
+                    if name in ID_COLUMNS:
+                        continue
+                elif name not in self.columns:
+                    continue
+                distribution = self.distributions.get(name)
+                if distribution is None:
+                    distribution = self.distributions[name] = Distribution(self.bin_widths.get(name))
+                distribution.add_values(batch[name])
+            if columns:
+                self.rows += len(batch[columns[0][0]])
+
+    def report(self, out=sys.stdout):
+        out.write("%s rows\n" % self.rows)
+        out.write("%-24s %12s %12s %12s %12s %12s %12s %12s\n" % (
+            "column", "mean", "stddev", "min", "p50", "p90", "p99", "max"))
+        for name in sorted(self.distributions):
+            distribution = self.distributions[name]
+            out.write("%-24s %12.3f %12.3f %12s %12s %12s %12s %12s\n" % ((
+                name, distribution.mean(), distribution.stddev()) + tuple(format_value(value) for value in (
+                distribution.minimum, distribution.percentile(0.5), distribution.percentile(0.9),
+                distribution.percentile(0.99), distribution.maximum))))
+
+# floats to the precision the bins keep
+def format_value(value):
+    if isinstance(value, float):
+        return '%.6g' % value
+    return str(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize column files written by headless games.")
+    parser.add_argument("files", nargs='+')
+    parser.add_argument("--columns", help="comma-separated columns to summarize; by default, all but %s" % ", ".join(ID_COLUMNS))
+    args = parser.parse_args()
+
+    columns = None
+    if args.columns:
+        columns = args.columns.split(',')
+
+    aggregator = Aggregator(columns)
+    for path in args.files:
+        aggregator.add_file(path)
+    aggregator.report()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+# Copyright 2012 Vincent Povirk
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Sweeps the difficulty knobs of the game presets, playing headless games at
+# each point until the mean survival time is known well enough, and reports
+# the points closest to the target survival times.
+#
+# Games that survive max_ticks are counted as surviving max_ticks, so targets
+# should be well below it.
+
+import sys
+import math
+import random
+import argparse
+import itertools
+import multiprocessing
+
+from simulation import *
+from headless import play_games_batched, policies, make_seeded_world
+from oracle import EndgameOracle, HOLD_WINDOW
+
+# z for a two-sided 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+class Point(object):
+    def __init__(self, turret_health_multiplier, place_turret_cooldown, num_waves, realtime, wave_size_range):
+        self.turret_health_multiplier = turret_health_multiplier
+        self.place_turret_cooldown = place_turret_cooldown
+        self.num_waves = num_waves
+        self.realtime = realtime
+        self.wave_size_range = wave_size_range
+
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.pending = 0
+        self.settled = False
+
+    def make_world(self, width, height):
+        world = World(width, height)
+        world.turret_health_multiplier = self.turret_health_multiplier
+        world.place_turret_cooldown = self.place_turret_cooldown
+        world.num_waves = self.num_waves
+        world.realtime = self.realtime
+        world.wave_size_range = self.wave_size_range
+        # the first turret was made with the default multiplier
+        world.next_turret = world.get_random_turret()
+        return world
+
+    def add_results(self, survived):
+        for ticks in survived:
+            self.count += 1
+            self.total += ticks
+            self.total_squares += float(ticks) * ticks
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def half_width(self):
+        if self.count < 2:
+            return float('inf')
+        mean = self.mean()
+        variance = max(0.0, (self.total_squares - self.count * mean * mean) / (self.count - 1))
+        return CONFIDENCE_Z * math.sqrt(variance / self.count)
+
+    def describe(self):
+        return "health=%s cooldown=%s waves=%s realtime=%s wave_size=%s-%s" % (
+            self.turret_health_multiplier, self.place_turret_cooldown, self.num_waves,
+            int(self.realtime), self.wave_size_range[0], self.wave_size_range[1])
+
+def parse_ints(text):
+    return [int(value) for value in text.split(',')]
+
+def parse_ranges(text):
+    result = []
+    for item in text.split(','):
+        low, high = item.split('-')
+        result.append((int(low), int(high)))
+    return result
+
+def make_points(args, rng):
+    grid = list(itertools.product(args.health, args.cooldown, args.waves,
+                                  [bool(value) for value in args.realtime], args.wave_sizes))
+    if args.samples and args.samples < len(grid):
+        grid = rng.sample(grid, args.samples)
+    return [Point(*values) for values in grid]
+
+def play_batch(args):
+    index, point, policy_name, width, height, seeds, max_ticks, hold_window = args
+    worlds = []
+    for seed in seeds:
+        worlds.append(make_seeded_world(point.make_world, width, height, seed))
+    # points that are too easy have games that hold until max_ticks, which
+    # the oracle counts instead of simulating
+    oracle = EndgameOracle(hold_window=hold_window)
+    results = play_games_batched(worlds, policies[policy_name](), max_ticks, oracle=oracle)
+    return index, [result.ticks for result in results]
+
+# a point is settled once its interval is narrow enough, or once it clearly
+# misses every target, so the remaining games go to points that might not
+def is_settled(point, targets, tolerance, min_games, max_games):
+    if point.count >= max_games:
+        return True
+    if point.count < min_games:
+        return False
+    mean = point.mean()
+    half_width = point.half_width()
+    if half_width <= tolerance:
+        return True
+    for target in targets:
+        if mean - half_width - tolerance <= target <= mean + half_width + tolerance:
+            return False
+    return True
+
+def sweep(points, targets, policy_name, width, height, processes, batch_games=16, min_games=32,
+          max_games=1024, tolerance=5.0, max_ticks=5000, seed=0, out=None, hold_window=HOLD_WINDOW):
+    pool = multiprocessing.Pool(processes)
+    next_seed = [seed]
+
+    def make_batch(index):
+        point = points[index]
+        point.pending += 1
+        seeds = range(next_seed[0], next_seed[0] + batch_games)
+        next_seed[0] += batch_games
+        return (index, point, policy_name, width, height, list(seeds), max_ticks, hold_window)
+
+    def wanted(point):
+        # don't queue more games than could be needed to reach max_games
+        return not point.settled and point.count + point.pending * batch_games < max_games
+
+    try:
+        # keep a couple of batches per process in flight, round robin over
+        # the unsettled points
+        pending = []
+        order = itertools.cycle(range(len(points)))
+        while True:
+            while len(pending) < processes * 2:
+                for i in range(len(points)):
+                    index = next(order)
+                    if wanted(points[index]):
+                        break
+                else:
+                    break
+                pending.append(pool.apply_async(play_batch, (make_batch(index),)))
+
+            if not pending:
+                break
+
+            index, survived = pending.pop(0).get()
+            point = points[index]
+            point.pending -= 1
+            point.add_results(survived)
+            if not point.settled and is_settled(point, targets, tolerance, min_games, max_games):
+                point.settled = True
+                if out is not None:
+                    out.write("%-60s %8.1f +- %6.1f (%s games)\n" % (
+                        point.describe(), point.mean(), point.half_width(), point.count))
+                    out.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+def report(points, targets, window, out=sys.stdout):
+    for target in targets:
+        out.write("\ntarget %s ticks:\n" % target)
+        matches = [point for point in points if abs(point.mean() - target) <= window]
+        matches.sort(key=lambda point: abs(point.mean() - target))
+        if not matches:
+            out.write("  no parameter sets within %s ticks\n" % window)
+        for point in matches:
+            out.write("  %-60s %8.1f +- %6.1f (%s games)\n" % (
+                point.describe(), point.mean(), point.half_width(), point.count))
+
+def main():
+    parser = argparse.ArgumentParser(description="Find difficulty settings that give target survival times.")
+    parser.add_argument("targets", nargs='+', type=float, help="target survival times, in ticks")
+    parser.add_argument("--policy", default="random", choices=sorted(policies))
+    parser.add_argument("--width", type=int, default=6)
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument("--health", type=parse_ints, default=[4, 5, 6], help="turret_health_multiplier values")
+    parser.add_argument("--cooldown", type=parse_ints, default=[3, 4, 8], help="place_turret_cooldown values")
+    parser.add_argument("--waves", type=parse_ints, default=[1], help="num_waves values")
+    parser.add_argument("--realtime", type=parse_ints, default=[0], help="realtime values, 0 or 1")
+    parser.add_argument("--wave-sizes", type=parse_ranges, default=[(3, 12)], help="wave size ranges, like 3-12,2-8")
+    parser.add_argument("--samples", type=int, help="evaluate this many random points of the grid")
+    parser.add_argument("--window", type=float, default=10.0, help="how close to a target a point must be")
+    parser.add_argument("--tolerance", type=float, default=5.0, help="confidence interval half-width to stop at")
+    parser.add_argument("--batch-games", type=int, default=16)
+    parser.add_argument("--min-games", type=int, default=32)
+    parser.add_argument("--max-games", type=int, default=1024)
+    parser.add_argument("--max-ticks", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--hold-window", type=int, default=HOLD_WINDOW,
+                        help="ticks a game has to hold its baddies at the top to be taken to hold until max-ticks, 0 to simulate them all")
+    args = parser.parse_args()
+
+    points = make_points(args, random.Random(args.seed))
+    processes = args.processes or multiprocessing.cpu_count()
+
+    sweep(points, args.targets, args.policy, args.width, args.height, processes, args.batch_games,
+          args.min_games, args.max_games, args.tolerance, args.max_ticks, args.seed, sys.stdout,
+          args.hold_window)
+
+    report(points, args.targets, args.window)
+
+if __name__ == '__main__':
+    main()
@@ -13,401 +13,34 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import sys
+import time
 import random
-random.seed()
+import argparse
 
 import pygame
 from pygame.locals import *
 
-class GameObject(object):
-    in_collision_check = False
-    
-    def collision_check(self, new_x, new_y, old_world, new_world):
-        obj = new_world.get_object(new_x, new_y)
-        if obj is not None and obj is not self:
-            return obj
-
-        obj = old_world.get_object(new_x, new_y)
-        if obj is not None and obj is not self and not old_world.is_destroyed(obj):
-            oth_x, oth_y = new_world.get_location(obj)
-            if oth_x == -1:
-                if self.in_collision_check:
-                    return True
-                else:
-                    self.in_collision_check = True
-                    obj.advance(old_world, new_world)
-                    self.in_collision_check = False
-                    oth_x, oth_y = new_world.get_location(obj)
-                    if (oth_x, oth_y) == (new_x, new_y):
-                        return True
-
-    def shoot(self, old_world, new_world):
-        pass
-
-    def get_initial_state(self):
-        pass
-
-class Baddie(GameObject):
-    def collision_check(self, new_x, new_y, old_world, new_world):
-        result = GameObject.collision_check(self, new_x, new_y, old_world, new_world)
-        if result is not None:
-            return result
-
-        obj = old_world.get_object(new_x, new_y)
-        if obj is not None and obj is not self and isinstance(obj, Baddie) and not old_world.is_destroyed(obj):
-            old_x, old_y = old_world.get_location(self)
-            oth_x, oth_y = new_world.get_location(obj)
-            for oth_pref_x, oth_pref_y, oth_pref_state in obj.get_preferred_locations(old_world):
-                if oth_pref_x == old_x and oth_pref_y == old_y:
-                    return obj
-                elif oth_pref_x == oth_x and oth_pref_y == oth_y:
-                    break
-    
-    def advance(self, old_world, new_world):
-        for x, y, new_state in self.get_preferred_locations(old_world):
-            if not self.collision_check(x, y, old_world, new_world):
-                new_world.add_object(x, y, self, new_state)
-                break
-        else:
-            old_x, old_y = old_world.get_location(self)
-
-            state = old_world.get_state(self, None)
-            new_world.add_object(old_x, old_y, self, state)
-
-    def get_preferred_locations(self, world):
-        return ()
-
-    def shoot(self, old_world, new_world):
-        target = None
-        target_health = 0
-        my_x, my_y = old_world.get_location(self)
-        for xofs, yofs in ((-1,0),(1,0),(0,-1),(0,1)):
-            obj = new_world.get_object(my_x + xofs, my_y + yofs)
-            if isinstance(obj, Turret):
-                cooldown, health = new_world.get_state(obj)
-                if target is None or health < target_health:
-                    target = obj
-                    target_health = health
-
-        if target is not None:
-            cooldown, health = new_world.get_state(target)
-            new_health = health - 4
-            x, y = new_world.get_location(target)
-            new_world.add_shot_animation(self, target)
-            if new_health <= 0:
-                new_world.destroy_object(target, self)
-            else:
-                new_world.add_object(x, y, target, (cooldown, new_health))
-
-class MarchingBaddie(Baddie):
-    def get_preferred_locations(self, world):
-        old_x, old_y = world.get_location(self)
-
-        direction = world.get_state(self)
-
-        yield old_x + direction, old_y, direction
-        yield old_x, old_y + 1, -direction
-        yield old_x - direction, old_y, -direction
-        yield old_x, old_y, -direction
-
-    def get_initial_state(self):
-        return random.randint(0, 1) or -1
-
-class FallingBaddie(Baddie):
-    def get_preferred_locations(self, world):
-        old_x, old_y = world.get_location(self)
-
-        direction = world.get_state(self)
-
-        yield old_x, old_y + 1, direction
-        yield old_x + direction, old_y + 1, direction
-        yield old_x - direction, old_y + 1, -direction
-        yield old_x + direction, old_y, direction
-        yield old_x - direction, old_y, -direction
-        yield old_x, old_y, -direction
-
-    def get_initial_state(self):
-        return random.randint(0, 1) or -1
-
-class Turret(GameObject):
-    cooldown = 1
-    starting_health = 4
-    
-    def advance(self, old_world, new_world):
-        old_x, old_y = old_world.get_location(self)
-
-        cooldown, health = old_world.get_state(self)
-
-        if cooldown > 0:
-            cooldown -= 1
-
-        new_world.add_object(old_x, old_y, self, (cooldown, health))
-
-    def shoot(self, old_world, new_world):
-        cooldown, health = new_world.get_state(self, (0, 12))
-        if cooldown:
-            return
-        
-        for x, y, in self.get_covered_locations(new_world):
-            obj = new_world.get_object(x, y)
-            if isinstance(obj, Baddie) and not new_world.is_destroyed(obj):
-                new_world.add_shot_animation(self, obj)
-                new_world.destroy_object(obj, self)
-
-                old_x, old_y = old_world.get_location(self)
-                cooldown = self.cooldown
-                health -= 1
-                if health <= 0:
-                    new_world.destroy_object(self)
-                else:
-                    new_world.add_object(old_x, old_y, self, (cooldown, health))
-                break
-
-    def get_covered_locations_at(self, world, x, y):
-        return ()
-
-    def get_covered_locations(self, world):
-        x, y = world.get_location(self)
-        return self.get_covered_locations_at(world, x, y)
-
-    def get_initial_state(self):
-        return (1, self.starting_health)
-
-class DirectionalTurret(Turret):
-    direction = (0, -1)
-
-    def get_covered_locations_at(self, world, x, y):
-        x_ofs, y_ofs = self.direction
-
-        while True:
-            x, y = x + x_ofs, y + y_ofs
-            obj = world.get_object(x, y)
-            if isinstance(obj, (OutOfBounds, Turret)):
-                break
-            yield x, y
-
-class KnightTurret(Turret):
-    def get_covered_locations_at(self, world, x, y):
-        for xofs, yofs in ((-1,2),(1,2),(-1,-2),(1,-2),(-2,1),(2,1),(-2,-1),(2,-1)):
-            obj = world.get_object(x + xofs, y + yofs)
-            if not isinstance(obj, (OutOfBounds, Turret)):
-                yield x + xofs, y + yofs
-
-class BishopTurret(Turret):
-    def get_covered_locations_at(self, world, x, y):
-        for x_ofs, y_ofs in ((-1,-1), (-1,1), (1,-1), (1,1)):
-            cx, cy = x, y
-            for i in range(2):
-                cx, cy = cx + x_ofs, cy + y_ofs
-                obj = world.get_object(cx, cy)
-                if isinstance(obj, (OutOfBounds, Turret)):
-                    break
-                yield cx, cy
-
-ACTION_NEWWORLD = "ACTION_NEWWORLD"
-ACTION_QUIT = "ACTION_QUIT"
-
-class Link(GameObject):
-    text = "text"
-    size = 1.0
-    action = None
-    action_args = ()
-
-    def advance(self, old_world, new_world):
-        old_x, old_y = old_world.get_location(self)
-
-        new_world.add_object(old_x, old_y, self, None)
-
-class OutOfBounds(object):
-    pass
-
-out_of_bounds = OutOfBounds()
-
-class World(object):
-    def __init__(self, width, height):
-        self.width = width
-        self.height = height
-
-        self.objects = [None] * (width * height)
-
-        self.object_to_pos = {}
-
-        self.object_state = {}
-
-        self.destroyed_objects = {}
-
-        self.mouse_pos = (-1, -1)
-
-        self.place_turret_cooldown = 3
-
-        self.place_turret_points = 0
-
-        self.shot_animations = []
+from simulation import *
+from heatmap import PlacementHeatmap
+from speculate import NextTickSpeculator
+from prediction import TrajectoryPredictor, PREDICT_STILL, PREDICT_SHOOTING
+from latency import LatencyTracer, NullTracer
+from quality import *
 
-        self.turret_health_multiplier = 4
+# pygame.font.Font loads the font file each time, so fonts are kept
+font_cache = {}
 
-        self.next_turret = self.get_random_turret()
-
-        self.waves = []
-
-        self.lost = False
-
-        self.score = 0
-
-        self.click_to_baddie = False
-
-        self.num_waves = 0
-
-        self.game_ui = True
-        
-        self.realtime = False
-
-        self.help_text = ""
-
-        self.help_text_on_top = False
-
-    def add_object(self, x, y, obj, state=None):
-        self.objects[x + y * self.width] = obj
-
-        self.object_to_pos[obj] = (x, y)
-
-        if state is None:
-            state = obj.get_initial_state()
-
-        self.object_state[obj] = state
-
-    def get_object(self, x, y):
-        if 0 <= x < self.width and 0 <= y < self.height:
-            return self.objects[x + y * self.width]
-
-        return out_of_bounds
-
-    def get_location(self, obj):
-        return self.object_to_pos.get(obj, (-1, -1))
-
-    def get_state(self, obj, default = None):
-        return self.object_state.get(obj, default)
-
-    def destroy_object(self, obj, destroyed_by=None):
-        self.destroyed_objects[obj] = destroyed_by
-
-    def is_destroyed(self, obj):
-        return obj in self.destroyed_objects
-
-    def destroyer(self, obj):
-        return self.destroyed_objects.get(obj, None)
-
-    def make_random_wave(self):
-        count = random.randint(3,12)
-        enemy_type = MarchingBaddie
-        enemy_initial_state = enemy_type().get_initial_state()
-        spawnx = random.randint(0,self.width-1)
-        return count, enemy_type, enemy_initial_state, spawnx
-
-    def advance(self, shoot=True):
-        result = World(self.width, self.height)
-
-        result.lost = self.lost
-
-        result.click_to_baddie = self.click_to_baddie
-
-        result.num_waves = self.num_waves
-
-        result.game_ui = self.game_ui
-
-        result.turret_health_multiplier = self.turret_health_multiplier
-
-        result.realtime = self.realtime
-
-        result.help_text = self.help_text
-
-        result.help_text_on_top = self.help_text_on_top
-
-        while len(self.waves) < self.num_waves:
-            self.waves.append(self.make_random_wave())
-
-        for count, enemy_type, enemy_initial_state, spawnx in self.waves:
-            enemy = enemy_type()
-            result.add_object(spawnx, 0, enemy, enemy_initial_state)
-            if count > 1:
-                result.waves.append((count-1, enemy_type, enemy_initial_state, spawnx))
-
-        for x in range(self.width):
-            for y in range(self.height-1, -1, -1):
-                obj = self.get_object(x, y)
-                if obj is not None and not self.is_destroyed(obj) and result.get_location(obj) == (-1,-1):
-                    obj.advance(self, result)
-
-        if shoot:
-            for x in range(self.width):
-                for y in range(self.height-1, -1, -1):
-                    obj = self.get_object(x, y)
-                    if obj is not None and not self.is_destroyed(obj):
-                        obj.shoot(self, result)
-
-        for x in range(self.width):
-            if not isinstance(result.get_object(x, self.height-1), Baddie):
-                break
-        else:
-            result.lost = True
-
-        if result.lost:
-            result.score = self.score
-        else:
-            result.score = self.score + 1
-
-        result.mouse_pos = self.mouse_pos
-
-        result.place_turret_cooldown = self.place_turret_cooldown
-        result.place_turret_points = self.place_turret_points + 1
-        
-        result.next_turret = self.next_turret
-
-        return result
-
-    def clicked(self, x, y):
-        obj = self.get_object(x, y)
-        if isinstance(obj, Link):
-            return obj
-        if self.click_to_baddie:
-            count, enemy_type, enemy_initial_state, spawnx = self.make_random_wave()
-            self.add_object(x, y, enemy_type(), enemy_initial_state)
-            return True
-        else:
-            if self.place_turret_cooldown <= self.place_turret_points and y != 0:
-                self.add_object(x, y, self.next_turret)
-                self.place_turret_points -= self.place_turret_cooldown
-                self.next_turret = self.get_random_turret()
-                return True
-
-    def hover(self, x, y):
-        self.mouse_pos = (x, y)
-
-    def add_shot_animation(self, source, target):
-        self.shot_animations.append((source, target))
-
-    def get_random_turret(self):
-        r = random.randint(0,5)
-        if r < 4:
-            result = DirectionalTurret()
-            result.direction = ((-1,0),(1,0),(0,-1),(0,1))[r]
-            if r == 3:
-                result.starting_health = 9 * self.turret_health_multiplier
-                result.cooldown = 1
-            else:
-                result.starting_health = self.turret_health_multiplier
-            return result
-        elif r == 4:
-            result = KnightTurret()
-            result.starting_health = self.turret_health_multiplier
-            return result
-        elif r == 5:
-            result = BishopTurret()
-            result.starting_health = self.turret_health_multiplier
-            return result
+def get_font(size):
+    size = int(size)
+    font = font_cache.get(size)
+    if font is None:
+        font = font_cache[size] = pygame.font.Font(None, size)
+    return font
 
 def draw_text(surface, text, x, y, size):
-    font = pygame.font.Font(None, size)
+    font = get_font(size)
 
     texts = []
 
@@ -422,221 +55,474 @@ def draw_text(surface, text, x, y, size):
         surface.blit(line, textpos)
         text_y += textpos.height
 
-def draw_world(old_world, world, t, surface, x, y, w, h, paused=False):
-    surface.fill(Color(0,0,0,255), Rect(x, y, w, h))
-    diagonal_pattern_surface = None
-
-    if world.help_text and not world.help_text_on_top:
-        draw_text(surface, world.help_text, 0, 0, int(h / world.height / 2))
+# sprites for tiles drawn with a single blits call, keyed by what they show
+sprite_cache = {}
+
+def get_tile_sprite(width, height, color, border=2):
+    key = ('tile', width, height, tuple(color), border)
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        sprite = pygame.Surface((width, height))
+        sprite.fill(Color(0,0,0,255))
+        sprite.fill(color, Rect(border, border, width - border * 2, height - border * 2))
+        sprite_cache[key] = sprite
+    return sprite
+
+def get_marching_baddie_sprite(width, height, vert_x1, vert_x2):
+    key = ('marching', width, height, vert_x1, vert_x2)
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        sprite = get_tile_sprite(width, height, Color(255,0,0,255)).copy()
+
+        pygame.draw.line(sprite, Color(0,0,0,255),
+                         (vert_x1, height / 2),
+                         (vert_x1, height * 5 / 6),
+                         2)
+
+        pygame.draw.line(sprite, Color(0,0,0,255),
+                         (vert_x2, height * 5 / 6),
+                         (vert_x2 + width / 3, height * 5 / 6),
+                         2)
+
+        sprite_cache[key] = sprite
+    return sprite
+
+def get_falling_baddie_sprite(width, height, vert_x1, vert_x2):
+    key = ('falling', width, height, vert_x1, vert_x2)
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        sprite = get_tile_sprite(width, height, Color(255,0,0,255)).copy()
+
+        pygame.draw.polygon(sprite, Color(0,0,0,255),
+                            [(vert_x1, height / 2),
+                             (vert_x2 + width / 3, height * 5 / 6),
+                             (vert_x1, height * 5 / 6),
+                             (vert_x2, height * 5 / 6),
+                             ])
+
+        sprite_cache[key] = sprite
+    return sprite
+
+def get_fill_sprite(width, height, color):
+    key = ('fill', width, height, tuple(color))
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        sprite = pygame.Surface((width, height))
+        sprite.fill(color)
+        sprite_cache[key] = sprite
+    return sprite
+
+# text that's drawn over and over, like turret stats and link labels
+def get_text_sprite(text, size, color, background=None):
+    if background is not None:
+        background = tuple(background)
+    key = ('text', text, int(size), tuple(color), background)
+    sprite = sprite_cache.get(key)
+    if sprite is None:
+        if background is None:
+            sprite = get_font(size).render(text, 1, color)
+        else:
+            sprite = get_font(size).render(text, 1, color, background)
+        sprite_cache[key] = sprite
+    return sprite
+
+# a turret's tile with its markings, but not its stats
+def get_turret_sprite(obj, draw_width, draw_height):
+    if isinstance(obj, DirectionalTurret):
+        key = ('turret', 'directional', draw_width, draw_height, obj.direction)
+    elif isinstance(obj, BishopTurret):
+        key = ('turret', 'bishop', draw_width, draw_height)
+    elif isinstance(obj, KnightTurret):
+        key = ('turret', 'knight', draw_width, draw_height)
+    else:
+        return get_tile_sprite(draw_width, draw_height, Color(0,0,255,255))
+
+    sprite = sprite_cache.get(key)
+    if sprite is not None:
+        return sprite
+
+    sprite = get_tile_sprite(draw_width, draw_height, Color(0,0,255,255)).copy()
+
+    if isinstance(obj, DirectionalTurret):
+        marking_width = draw_width * 2 / 5
+        marking_height = draw_height * 2 / 5
+
+        if obj.direction[0] == -1:
+            marking_x = 0
+        elif obj.direction[0] == 0:
+            marking_x = (draw_width - marking_width) / 2
+        else:
+            marking_x = draw_width - marking_width
 
-    for obj_x in range(world.width):
-        for obj_y in range(world.height):
-            obj = world.get_object(obj_x, obj_y)
-            if obj is not None:
-                prev_x, prev_y = old_world.get_location(obj)
-                
-                if prev_x in (obj_x, -1):
-                    draw_x = obj_x * w / world.width
+        if obj.direction[1] == -1:
+            marking_y = 0
+        elif obj.direction[1] == 0:
+            marking_y = (draw_height - marking_height) / 2
+        else:
+            marking_y = draw_height - marking_height
+
+        sprite.fill(Color(48,48,48,255), Rect(marking_x, marking_y, marking_width, marking_height), BLEND_ADD)
+    elif isinstance(obj, BishopTurret):
+        diagonal_pattern_surface = pygame.Surface((draw_width, draw_height))
+
+        marking_width = draw_width / 5
+        marking_height = draw_height / 5
+
+        for dir_x in (-1,1):
+            for dir_y in (-1,1):
+                if dir_x == -1:
+                    x_pos = (0,
+                             marking_width,
+                             marking_width * 2,
+                             marking_width * 2,
+                             marking_width,
+                             0)
                 else:
-                    draw_x = int(((1.0-t) * prev_x + t * obj_x) * w / world.width)
-                if prev_y in (obj_y, -1):
-                    draw_y = obj_y * h / world.height
+                    x_pos = (draw_width - 1,
+                             draw_width - 1 - marking_width,
+                             draw_width - 1 - marking_width * 2,
+                             draw_width - 1 - marking_width * 2,
+                             draw_width - 1 - marking_width,
+                             draw_width - 1)
+
+                if dir_y == -1:
+                    y_pos = (0,
+                             0,
+                             marking_height,
+                             marking_height * 2,
+                             marking_height * 2,
+                             marking_height)
                 else:
-                    draw_y = int(((1.0-t) * prev_y + t * obj_y) * h / world.height)
-                
-                draw_width = w / world.width
-                draw_height = h / world.height
-                surface.fill(Color(0,0,0,255), Rect(draw_x, draw_y, draw_width, draw_height))
-                if isinstance(obj, Baddie):
-                    surface.fill(Color(255,0,0,255), Rect(draw_x+2, draw_y+2, draw_width-4, draw_height-4))
+                    y_pos = (draw_height - 1,
+                             draw_height - 1,
+                             draw_height - 1 - marking_height,
+                             draw_height - 1 - marking_height * 2,
+                             draw_height - 1 - marking_height * 2,
+                             draw_height - 1 - marking_height)
+
+                pygame.draw.polygon(diagonal_pattern_surface, Color(48,48,48,255), list(zip(x_pos, y_pos)))
+
+        sprite.blit(diagonal_pattern_surface, (0, 0), special_flags=BLEND_ADD)
+    else:
+        pygame.draw.circle(sprite, Color(48,48,255,255),
+                           (draw_width // 2, draw_height // 2),
+                           (draw_width // 2) - 2)
+
+        pygame.draw.circle(sprite, Color(0,0,255,255),
+                           (draw_width // 2, draw_height // 2),
+                           draw_width // 4)
+
+    sprite_cache[key] = sprite
+    return sprite
+
+def blit_all(surface, blit_sequence):
+    if hasattr(surface, 'blits'):
+        surface.blits(blit_sequence, False)
+    else:
+        for sprite, dest in blit_sequence:
+            surface.blit(sprite, dest)
+
+TILE_MOVING = 0
+TILE_VANISHING = 1
+
+# Positions of everything drawn as a tile, gathered once per pair of worlds so
+# that each frame only has to interpolate.
+class TickLayout(object):
+    def __init__(self, old_world, world, w, h, previous=None):
+        self.old_world = old_world
+        self.world = world
+        self.w = w
+        self.h = h
+        # clicks change worlds in place, which needs a new layout
+        self.changes = (old_world.changes, world.changes)
+
+        # layers are redrawn at most once per tick, into surfaces reused from
+        # the previous tick
+        self.static_layer = None
+        self.static_layer_key = None
+        self.static_drawn = False
+        self.coverage_layer = None
+        self.coverage_drawn = False
+        # whether the coverage layer still has the previous tick's coverage,
+        # which can stand in for this tick's at lower quality
+        self.coverage_inherited = False
+        if previous is not None and (previous.w, previous.h) == (w, h):
+            self.static_layer = previous.static_layer
+            self.coverage_layer = previous.coverage_layer
+            # a layout remade after a click has a tick's worth of coverage
+            # missing already
+            self.coverage_inherited = previous.coverage_drawn and previous.world is not world
+
+        # the blits of the last frame, reused when a frame draws the same t
+        self.tile_blits = None
+        self.tile_blits_key = None
+        self.shot_blits = None
+        self.shot_blits_key = None
+
+        # (obj, draw_x, draw_y) for turrets and links, which never move
+        self.fixed = []
+
+        # (TILE_MOVING, obj, x params, y params, prev direction, direction) or
+        # (TILE_VANISHING, obj, x, y), in drawing order; each of the params is
+        # (static position or None, previous location, location)
+        self.tiles = []
+
+        # (source, target, x params, y params)
+        self.shots = []
+
+        for obj_x in range(world.width):
+            for obj_y in range(world.height):
+                obj = world.get_object(obj_x, obj_y)
+                if isinstance(obj, (Turret, Link)):
+                    self.fixed.append((obj, obj_x * w / world.width, obj_y * h / world.height))
+                elif obj is not None:
+                    prev_x, prev_y = old_world.get_location(obj)
 
-                    if isinstance(obj, MarchingBaddie):
+                    if isinstance(obj, Baddie):
                         direction = world.get_state(obj)
                         prev_direction = old_world.get_state(obj, direction)
+                    else:
+                        direction = prev_direction = None
 
-                        direction = ((1.0-t) * prev_direction + t * direction)
+                    self.tiles.append((TILE_MOVING, obj,
+                        self.axis_params(prev_x, obj_x, w, world.width),
+                        self.axis_params(prev_y, obj_y, h, world.height),
+                        prev_direction, direction))
 
-                        vert_x = int((direction + 1.5) * draw_width / 3)
+                obj = old_world.get_object(obj_x, obj_y)
+                if obj is not None and world.get_location(obj) == (-1,-1):
+                    old_x, old_y = old_world.get_location(obj)
+                    self.tiles.append((TILE_VANISHING, obj, old_x, old_y))
 
-                        pygame.draw.line(surface, Color(0,0,0,255),
-                                         (draw_x + vert_x, draw_y + draw_height / 2),
-                                         (draw_x + vert_x, draw_y + draw_height * 5 / 6),
-                                         2)
+        self.has_links = any(isinstance(obj, Link) for obj, draw_x, draw_y in self.fixed)
 
-                        vert_x = int((direction + 2.0) * draw_width / 6)
+        self.moving = [tile for tile in self.tiles if tile[0] == TILE_MOVING]
+        self.moving_x_params = [tile[2] for tile in self.moving]
+        self.moving_y_params = [tile[3] for tile in self.moving]
 
-                        pygame.draw.line(surface, Color(0,0,0,255),
-                                         (draw_x + vert_x, draw_y + draw_height * 5 / 6),
-                                         (draw_x + vert_x + draw_width / 3, draw_y + draw_height * 5 / 6),
-                                         2)
-                    elif isinstance(obj, FallingBaddie):
-                        direction = world.get_state(obj)
-                        prev_direction = old_world.get_state(obj, direction)
+        for source, target in world.shot_animations:
+            prev_x, prev_y = old_world.get_location(source)
+            obj_x, obj_y = world.get_location(target)
+            self.shots.append((source, target,
+                self.axis_params(prev_x, obj_x, w, world.width),
+                self.axis_params(prev_y, obj_y, h, world.height)))
 
-                        direction = ((1.0-t) * prev_direction + t * direction)
+        self.shot_x_params = [shot[2] for shot in self.shots]
+        self.shot_y_params = [shot[3] for shot in self.shots]
 
-                        vert_x1 = int((direction + 1.5) * draw_width / 3)
+    def axis_params(self, prev, pos, size, count):
+        if prev in (pos, -1):
+            return (int(pos * size / count), prev, pos)
+        else:
+            return (None, prev, pos)
 
-                        vert_x2 = int((direction + 2.0) * draw_width / 6)
+    def get_static_layer(self, stats=True):
+        # links light up under the mouse
+        if self.has_links:
+            key = (self.world.mouse_pos, stats)
+        else:
+            key = stats
+
+        if not self.static_drawn or self.static_layer_key != key:
+            if self.static_layer is None:
+                self.static_layer = pygame.Surface((self.w, self.h))
+            draw_static_layer(self.world, self.fixed, self.static_layer, self.w, self.h, stats)
+            self.static_layer_key = key
+            self.static_drawn = True
+
+        return self.static_layer
+
+    def get_coverage_layer(self, stale_ok=False):
+        # a tick showing the previous tick's coverage means the next one
+        # won't inherit any, so it's at most a tick out of date
+        if stale_ok and self.coverage_inherited and not self.coverage_drawn:
+            return self.coverage_layer
+
+        if not self.coverage_drawn:
+            if self.coverage_layer is None:
+                self.coverage_layer = pygame.Surface((self.w, self.h))
+            draw_coverage_layer(self.world, self.coverage_layer, self.w, self.h)
+            self.coverage_drawn = True
+
+        return self.coverage_layer
+
+    def matches(self, old_world, world, w, h):
+        return (self.old_world is old_world and self.world is world and self.w == w and self.h == h and
+                self.changes == (old_world.changes, world.changes))
+
+    def interpolate(self, params, t, size, count):
+        return [static if static is not None else int(((1.0-t) * prev + t * pos) * size / count)
+                for static, prev, pos in params]
+
+    def get_tile_blits(self, t, paused):
+        if self.tile_blits_key != (t, paused):
+            self.tile_blits = self.make_tile_blits(t, paused)
+            self.tile_blits_key = (t, paused)
+        return self.tile_blits
+
+    def make_tile_blits(self, t, paused):
+        world = self.world
+        w = self.w
+        h = self.h
+
+        draw_width = int(w / world.width)
+        draw_height = int(h / world.height)
+
+        xs = self.interpolate(self.moving_x_params, t, w, world.width)
+        ys = self.interpolate(self.moving_y_params, t, h, world.height)
+
+        shrunk_width = int((1.0-t) * (w / world.width))
+        shrunk_height = int((1.0-t) * (h / world.height))
+
+        result = []
+        i = 0
+        for tile in self.tiles:
+            obj = tile[1]
+            if tile[0] == TILE_MOVING:
+                draw_x = xs[i]
+                draw_y = ys[i]
+                i += 1
+
+                if isinstance(obj, (MarchingBaddie, FallingBaddie)):
+                    direction = ((1.0-t) * tile[4] + t * tile[5])
+                    vert_x1 = int((direction + 1.5) * draw_width / 3)
+                    vert_x2 = int((direction + 2.0) * draw_width / 6)
+                    if isinstance(obj, MarchingBaddie):
+                        sprite = get_marching_baddie_sprite(draw_width, draw_height, vert_x1, vert_x2)
+                    else:
+                        sprite = get_falling_baddie_sprite(draw_width, draw_height, vert_x1, vert_x2)
+                elif isinstance(obj, Baddie):
+                    sprite = get_tile_sprite(draw_width, draw_height, Color(255,0,0,255))
+                else:
+                    sprite = get_fill_sprite(draw_width, draw_height, Color(255,0,255,255))
 
-                        pygame.draw.polygon(surface, Color(0,0,0,255),
-                                            [(draw_x + vert_x1, draw_y + draw_height / 2),
-                                             (draw_x + vert_x2 + draw_width / 3, draw_y + draw_height * 5 / 6),
-                                             (draw_x + vert_x1, draw_y + draw_height * 5 / 6),
-                                             (draw_x + vert_x2, draw_y + draw_height * 5 / 6),
-                                             ])
+                result.append((sprite, (draw_x, draw_y)))
+            elif shrunk_width > 4 and shrunk_height > 4:
+                obj_x, obj_y = tile[2], tile[3]
+                draw_x = int(obj_x * w / world.width + (w / world.width - shrunk_width) / 2)
+                draw_y = int(obj_y * h / world.height + (h / world.height - shrunk_height) / 2)
 
+                if isinstance(obj, Baddie):
+                    if paused:
+                        sprite = get_tile_sprite(shrunk_width, shrunk_height, Color(48,0,0,255))
+                    else:
+                        sprite = get_tile_sprite(shrunk_width, shrunk_height, Color(255,0,0,255))
                 elif isinstance(obj, Turret):
-                    surface.fill(Color(0,0,255,255), Rect(draw_x+2, draw_y+2, draw_width-4, draw_height-4))
+                    if paused:
+                        sprite = get_tile_sprite(shrunk_width, shrunk_height, Color(0,0,48,255))
+                    else:
+                        sprite = get_tile_sprite(shrunk_width, shrunk_height, Color(0,0,255,255))
+                else:
+                    sprite = get_fill_sprite(shrunk_width, shrunk_height, Color(255,0,255,255))
 
-                    cooldown, health = world.get_state(obj, (0, obj.starting_health))
+                result.append((sprite, (draw_x, draw_y)))
 
-                    if isinstance(obj, DirectionalTurret):
-                        marking_width = draw_width * 2 / 5
-                        marking_height = draw_height * 2 / 5
+        return result
 
-                        if obj.direction[0] == -1:
-                            marking_x = draw_x
-                        elif obj.direction[0] == 0:
-                            marking_x = draw_x + (draw_width - marking_width) / 2
-                        else:
-                            marking_x = draw_x + draw_width - marking_width
+    def get_shot_blits(self, t):
+        if self.shot_blits_key != t:
+            self.shot_blits = self.make_shot_blits(t)
+            self.shot_blits_key = t
+        return self.shot_blits
+
+    def make_shot_blits(self, t):
+        world = self.world
+        w = self.w
+        h = self.h
+
+        xs = self.interpolate(self.shot_x_params, t, w, world.width)
+        ys = self.interpolate(self.shot_y_params, t, h, world.height)
+
+        draw_width = w / world.width
+        draw_height = h / world.height
+        bullet_width = w / world.width / 8
+        bullet_height = h / world.height / 8
+
+        baddie_bullet = get_fill_sprite(int(bullet_width), int(bullet_height), Color(0,255,128,255))
+        turret_bullet = get_fill_sprite(int(bullet_width), int(bullet_height), Color(255,128,0,255))
+
+        result = []
+        for shot, draw_x, draw_y in zip(self.shots, xs, ys):
+            draw_x = int(draw_x + (draw_width - bullet_width) / 2)
+            draw_y = int(draw_y + (draw_height - bullet_height) / 2)
+            if isinstance(shot[0], Baddie):
+                result.append((baddie_bullet, (draw_x, draw_y)))
+            else:
+                result.append((turret_bullet, (draw_x, draw_y)))
+        return result
 
-                        if obj.direction[1] == -1:
-                            marking_y = draw_y
-                        elif obj.direction[1] == 0:
-                            marking_y = draw_y + (draw_height - marking_height) / 2
-                        else:
-                            marking_y = draw_y + draw_height - marking_height
-
-                        surface.fill(Color(48,48,48,255), Rect(marking_x, marking_y, marking_width, marking_height), BLEND_ADD)
-                    elif isinstance(obj, BishopTurret):
-                        if diagonal_pattern_surface is None:
-                            diagonal_pattern_surface = pygame.Surface((draw_width, draw_height), HWSURFACE)
-
-                            marking_width = draw_width / 5
-                            marking_height = draw_height / 5
-
-                            for dir_x in (-1,1):
-                                for dir_y in (-1,1):
-                                    if dir_x == -1:
-                                        x_pos = (0,
-                                                 marking_width,
-                                                 marking_width * 2,
-                                                 marking_width * 2,
-                                                 marking_width,
-                                                 0)
-                                    else:
-                                        x_pos = (draw_width - 1,
-                                                 draw_width - 1 - marking_width,
-                                                 draw_width - 1 - marking_width * 2,
-                                                 draw_width - 1 - marking_width * 2,
-                                                 draw_width - 1 - marking_width,
-                                                 draw_width - 1)
-
-                                    if dir_y == -1:
-                                        y_pos = (0,
-                                                 0,
-                                                 marking_height,
-                                                 marking_height * 2,
-                                                 marking_height * 2,
-                                                 marking_height)
-                                    else:
-                                        y_pos = (draw_height - 1,
-                                                 draw_height - 1,
-                                                 draw_height - 1 - marking_height,
-                                                 draw_height - 1 - marking_height * 2,
-                                                 draw_height - 1 - marking_height * 2,
-                                                 draw_height - 1 - marking_height)
-
-                                    pygame.draw.polygon(diagonal_pattern_surface, Color(48,48,48,255), zip(x_pos, y_pos))
-
-                        surface.blit(diagonal_pattern_surface, (draw_x, draw_y), special_flags=BLEND_ADD)
-                    elif isinstance(obj, KnightTurret):
-                        pygame.draw.circle(surface, Color(48,48,255,255),
-                                           (draw_x + draw_width/2, draw_y + draw_height/2),
-                                           (draw_width / 2) - 2)
-
-                        pygame.draw.circle(surface, Color(0,0,255,255),
-                                           (draw_x + draw_width/2, draw_y + draw_height/2),
-                                           draw_width / 4)
-
-                    #draw stats
-                    font = pygame.font.Font(None, draw_height / 3)
-
-                    # cooldown
-                    if obj.cooldown > 1:
-                        text = font.render("%s/%s" % (cooldown, obj.cooldown)
-                            , 1, Color(240, 240, 240, 255))
-                        textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height/3)
-                        surface.blit(text, textpos)
-
-                    # health
-                    text = font.render("%s/%s" % (health, obj.starting_health)
-                        , 1, Color(240, 240, 240, 255))
-                    if isinstance(obj, DirectionalTurret) and obj.direction == (0, 1):
-                        textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height/3)
-                    elif isinstance(obj, DirectionalTurret) and obj.direction == (0, -1):
-                        textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height*2/3)
-                    else:
-                        textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height/2)
-                    surface.blit(text, textpos)
-                elif isinstance(obj, Link):
-                    if world.mouse_pos == (obj_x, obj_y):
-                        link_color = Color(0,255,0,255)
-                    else:
-                        link_color = Color(0,128,0,255)
-                    surface.fill(link_color, Rect(draw_x+2, draw_y+2, draw_width-4, draw_height-4))
+tick_layout = None
 
-                    font = pygame.font.Font(None, int(draw_height * obj.size))
+def get_tick_layout(old_world, world, w, h):
+    global tick_layout
+    if tick_layout is None or not tick_layout.matches(old_world, world, w, h):
+        tick_layout = TickLayout(old_world, world, w, h, tick_layout)
+    return tick_layout
 
-                    texts = []
+def get_link_color(world, obj):
+    if world.mouse_pos == world.get_location(obj):
+        return Color(0,255,0,255)
+    else:
+        return Color(0,128,0,255)
 
-                    for line in obj.text.split('\n'):
-                        text = font.render(line, 1, Color(0, 0, 0, 255), link_color)
-                        texts.append(text)
+# draws everything that stays the same for all frames of a tick
+def draw_static_layer(world, fixed, surface, w, h, stats=True):
+    surface.fill(Color(0,0,0,255), Rect(0, 0, w, h))
 
-                    vert_height = sum(line.get_height() for line in texts)
+    if world.help_text and not world.help_text_on_top:
+        draw_text(surface, world.help_text, 0, 0, int(h / world.height / 2))
 
-                    text_y = draw_y + (draw_height - vert_height) / 2
+    for obj, draw_x, draw_y in fixed:
+        draw_width = w / world.width
+        draw_height = h / world.height
+        if isinstance(obj, Turret):
+            surface.blit(get_turret_sprite(obj, int(draw_width), int(draw_height)), (draw_x, draw_y))
 
-                    for line in texts:
-                        textpos = line.get_rect(centerx=draw_x+draw_width/2, y=text_y)
-                        surface.blit(line, textpos)
-                        text_y += textpos.height
-                else:
-                    surface.fill(Color(255,0,255,255), Rect(draw_x, draw_y, draw_width, draw_height))
-
-            obj = old_world.get_object(obj_x, obj_y)
-            if obj is not None and world.get_location(obj) == (-1,-1):
-                obj_x, obj_y = old_world.get_location(obj)
-                
-                draw_x = obj_x * w / world.width
-                draw_y = obj_y * h / world.height
-                
-                full_draw_width = w / world.width
-                full_draw_height = h / world.height
-
-                draw_width = int((1.0-t) * full_draw_width)
-                draw_height = int((1.0-t) * full_draw_height)
-
-                if draw_width > 4 and draw_height > 4:
-                    draw_x += (full_draw_width - draw_width) / 2
-                    draw_y += (full_draw_height - draw_height) / 2
-                
-                    surface.fill(Color(0,0,0,255), Rect(draw_x, draw_y, draw_width, draw_height))
-                    if isinstance(obj, Baddie):
-                        if paused:
-                            surface.fill(Color(48,0,0,255), Rect(draw_x+2, draw_y+2, draw_width-4, draw_height-4))
-                        else:
-                            surface.fill(Color(255,0,0,255), Rect(draw_x+2, draw_y+2, draw_width-4, draw_height-4))
-                    elif isinstance(obj, Turret):
-                        if paused:
-                            surface.fill(Color(0,0,48,255), Rect(draw_x+2, draw_y+2, draw_width-4, draw_height-4))
-                        else:
-                            surface.fill(Color(0,0,255,255), Rect(draw_x+2, draw_y+2, draw_width-4, draw_height-4))
-                    else:
-                        surface.fill(Color(255,0,255,255), Rect(draw_x, draw_y, draw_width, draw_height))
+            cooldown, health = world.get_state(obj, (0, obj.starting_health))
+
+            if not stats:
+                continue
+
+            #draw stats
+            font_size = int(draw_height / 3)
+
+            # cooldown
+            if obj.cooldown > 1:
+                text = get_text_sprite("%s/%s" % (cooldown, obj.cooldown), font_size, Color(240, 240, 240, 255))
+                textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height/3)
+                surface.blit(text, textpos)
+
+            # health
+            text = get_text_sprite("%s/%s" % (health, obj.starting_health), font_size, Color(240, 240, 240, 255))
+            if isinstance(obj, DirectionalTurret) and obj.direction == (0, 1):
+                textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height/3)
+            elif isinstance(obj, DirectionalTurret) and obj.direction == (0, -1):
+                textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height*2/3)
+            else:
+                textpos = text.get_rect(centerx=draw_x+draw_width/2, centery=draw_y+draw_height/2)
+            surface.blit(text, textpos)
+        elif isinstance(obj, Link):
+            link_color = get_link_color(world, obj)
+            surface.blit(get_tile_sprite(int(draw_width), int(draw_height), link_color), (draw_x, draw_y))
+
+            texts = []
+
+            for line in obj.text.split('\n'):
+                text = get_text_sprite(line, int(draw_height * obj.size), Color(0, 0, 0, 255), link_color)
+                texts.append(text)
+
+            vert_height = sum(line.get_height() for line in texts)
+
+            text_y = draw_y + (draw_height - vert_height) / 2
+
+            for line in texts:
+                textpos = line.get_rect(centerx=draw_x+draw_width/2, y=text_y)
+                surface.blit(line, textpos)
+                text_y += textpos.height
+
+# squares covered by turrets are brightened by adding this layer
+def draw_coverage_layer(world, surface, w, h):
+    surface.fill(Color(0,0,0,255), Rect(0, 0, w, h))
 
     for obj_x in range(world.width):
         for obj_y in range(world.height):
@@ -650,30 +536,51 @@ def draw_world(old_world, world, t, surface, x, y, w, h, paused=False):
                     draw_height = h / world.height
                     surface.fill(Color(48,48,48,255), Rect(draw_x, draw_y, draw_width, draw_height), BLEND_ADD)
 
+def draw_predictions(surface, predictor, x, y, w, h, world):
+    draw_width = w / world.width
+    draw_height = h / world.height
+
+    def center(cx, cy):
+        return (cx * w / world.width + x + draw_width / 2, cy * h / world.height + y + draw_height / 2)
+
+    for kind, color in ((PREDICT_STILL, Color(96,96,192,255)), (PREDICT_SHOOTING, Color(255,160,64,255))):
+        paths, destroyed = predictor.get_paths(kind)
+        for obj, path in paths.items():
+            points = [center(cx, cy) for cx, cy in path]
+            if len(points) > 1:
+                pygame.draw.lines(surface, color, False, points, 2)
+            if obj in destroyed:
+                end_x, end_y = points[-1]
+                pygame.draw.circle(surface, color, (int(end_x), int(end_y)), int(min(draw_width, draw_height) / 6), 2)
+
+def draw_world(old_world, world, t, surface, x, y, w, h, paused=False, heatmap=None, predictor=None, quality=QUALITY_FULL):
+    layout = get_tick_layout(old_world, world, w, h)
+
+    if quality >= QUALITY_NO_INTERPOLATION:
+        # two sets of blits per tick, each made once
+        t = 1.0 if t >= 0.5 else 0.0
+
+    surface.blit(layout.get_static_layer(quality < QUALITY_NO_STATS), (x, y))
+
+    # baddies and vanishing objects move over the fixed tiles
+    blit_all(surface, layout.get_tile_blits(t, paused))
+
+    surface.blit(layout.get_coverage_layer(quality >= QUALITY_STALE_COVERAGE), (x, y), special_flags=BLEND_ADD)
+
+    if heatmap:
+        # expected benefit of placing next_turret, from 0.0 to 1.0
+        draw_width = w / world.width
+        draw_height = h / world.height
+        for (cx, cy), value in heatmap.items():
+            shade = int(value * 96)
+            if shade > 0:
+                surface.fill(Color(0,shade,shade//2,255), Rect(cx * w / world.width, cy * h / world.height, draw_width, draw_height), BLEND_ADD)
+
+    if predictor is not None:
+        draw_predictions(surface, predictor, x, y, w, h, world)
+
     if not paused:
-        for source, target in world.shot_animations:
-            prev_x, prev_y = old_world.get_location(source)
-            obj_x, obj_y = world.get_location(target)
-            
-            if prev_x in (obj_x, -1):
-                draw_x = obj_x * w / world.width
-            else:
-                draw_x = int(((1.0-t) * prev_x + t * obj_x) * w / world.width)
-            if prev_y in (obj_y, -1):
-                draw_y = obj_y * h / world.height
-            else:
-                draw_y = int(((1.0-t) * prev_y + t * obj_y) * h / world.height)
-            
-            draw_width = w / world.width
-            draw_height = h / world.height
-            bullet_width = w / world.width / 8
-            bullet_height = h / world.height / 8
-            draw_x += (draw_width - bullet_width) / 2
-            draw_y += (draw_height - bullet_height) / 2
-            if isinstance(source, Baddie):
-                surface.fill(Color(0,255,128,255), Rect(draw_x, draw_y, bullet_width, bullet_height))
-            else:
-                surface.fill(Color(255,128,0,255), Rect(draw_x, draw_y, bullet_width, bullet_height))
+        blit_all(surface, layout.get_shot_blits(t))
 
     if not world.click_to_baddie and world.place_turret_cooldown <= world.place_turret_points:
         # draw turret to be placed
@@ -716,426 +623,49 @@ def draw_world(old_world, world, t, surface, x, y, w, h, paused=False):
     if world.help_text and world.help_text_on_top:
         draw_text(surface, world.help_text, 0, 0, int(h / world.height / 2))
 
-def make_hard_game(width, height):
-    world = World(width, height)
-    world.num_waves = 1
-    world.place_turret_cooldown = 4
-
-    return world
-
-def make_insane_game(width, height):
-    world = World(width, height)
-    world.turret_health_multiplier = 6
-    world.place_turret_cooldown = 8
-    world.num_waves = 1
-    world.next_turret = world.get_random_turret() #FIXME
-    world.realtime = True
-
-    return world
+# ticks per 20 frames; 0 runs as many ticks as fit in TURBO_FRAME_BUDGET
+TURBO_SPEEDS = (1, 2, 10, 100, 0)
+
+# seconds of each 15ms frame that turbo speeds may spend on ticks
+TURBO_FRAME_BUDGET = 0.010
+
+# positions remembered for the title and help screens, which have at most a
+# few dozen
+TITLE_CACHE_SIZE = 64
+
+# seconds of each frame drawing should take, which is what turbo speeds leave
+RENDER_BUDGET = 0.015 - TURBO_FRAME_BUDGET
 
-def make_normal_game(width, height):
-    world = World(width, height)
-    world.num_waves = 1
-
-    return world
-
-def make_easy_game(width, height):
-    world = World(width, height)
-    world.turret_health_multiplier = 5
-    world.num_waves = 1
-    world.next_turret = world.get_random_turret() #FIXME
-
-    return world
-
-def make_help_world1(width, height):
-    world = World(width, height)
-    world.place_turret_cooldown = 1
-    world.game_ui = False
-
-    world.help_text = """
-Click to place a turret.
-
-The red x's show where the new
-turret will be able to fire.
-
-Every few turns, a new turret
-can be placed.
-
-The types of new turrets are
-chosen randomly.
-
-Squares covered by turrets
-are brightened."""
-
-    link = Link()
-    link.text = "Title"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_title_world
-    world.add_object(0, 7, link)
-
-    link = Link()
-    link.text = "" # Prev
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world1
-    world.add_object(1, 7, link)
-
-    link = Link()
-    link.text = "Page\n1 of 5"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world1
-    world.add_object(2, 7, link)
-
-    link = Link()
-    link.text = "Next"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world2
-    world.add_object(3, 7, link)
-
-    link = Link()
-    link.text = ""
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world1
-    world.add_object(4, 7, link)
-
-    link = Link()
-    link.text = "Reset"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world1
-    world.add_object(5, 7, link)
-
-    return world
-
-def make_help_world2(width, height):
-    world = World(width, height)
-    world.click_to_baddie = True
-    world.game_ui = False
-
-    world.help_text = """
-Click to place an enemy.
-
-Pay attention to how they move.
-
-Enemies will always move in the
-direction they face when possible.
-
-Otherwise, they will turn around,
-and attempt to move down.
-
-Failing that, they will try to move
-to the new direction they face.
-
-Predicting where enemies will go
-is very important."""
-
-    link = Link()
-    link.text = "Title"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_title_world
-    world.add_object(0, 7, link)
-
-    link = Link()
-    link.text = "Prev"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world1
-    world.add_object(1, 7, link)
-
-    link = Link()
-    link.text = "Page\n2 of 5"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world2
-    world.add_object(2, 7, link)
-
-    link = Link()
-    link.text = "Next"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world3
-    world.add_object(3, 7, link)
-
-    link = Link()
-    link.text = ""
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world2
-    world.add_object(4, 7, link)
-
-    link = Link()
-    link.text = "Reset"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world2
-    world.add_object(5, 7, link)
-
-    return world
-
-def make_help_world3(width, height):
-    world = World(width, height)
-    world.click_to_baddie = True
-    world.game_ui = False
-    world.num_waves = 1
-    world.help_text_on_top = True
-
-    world.help_text = """
-Enemies appear constantly at the
-top of the screen.
-
-When the bottom row is filled
-with enemies, the game is lost.
-
-The goal is to survive as long
-as possible."""
-
-    link = Link()
-    link.text = "Title"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_title_world
-    world.add_object(0, 7, link)
-
-    link = Link()
-    link.text = "Prev"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world2
-    world.add_object(1, 7, link)
-
-    link = Link()
-    link.text = "Page\n3 of 5"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world3
-    world.add_object(2, 7, link)
-
-    link = Link()
-    link.text = "Next"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world4
-    world.add_object(3, 7, link)
-
-    link = Link()
-    link.text = ""
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world3
-    world.add_object(4, 7, link)
-
-    link = Link()
-    link.text = "Reset"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world3
-    world.add_object(5, 7, link)
-
-    return world
-
-def make_help_world4(width, height):
-    world = World(width, height)
-    world.place_turret_cooldown = 10000
-    world.place_turret_points = 10000
-    world.game_ui = False
-    world.next_turret = DirectionalTurret()
-
-    world.help_text = """
-Enemies move, but turrets do not.
-
-It takes a single turn to fire.
-
-That means that a turret can hit
-an enemy only if the enemy WILL
-BE in the turret's range next turn.
-
-Enemies will attack your turrets
-when they are directly adjacent."""
-
-    link = Link()
-    link.text = "Title"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_title_world
-    world.add_object(0, 7, link)
-
-    link = Link()
-    link.text = "Prev"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world3
-    world.add_object(1, 7, link)
-
-    link = Link()
-    link.text = "Page\n4 of 5"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world4
-    world.add_object(2, 7, link)
-
-    link = Link()
-    link.text = "Next"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world5
-    world.add_object(3, 7, link)
-
-    link = Link()
-    link.text = ""
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world4
-    world.add_object(4, 7, link)
-
-    link = Link()
-    link.text = "Reset"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world4
-    world.add_object(5, 7, link)
-
-    world.add_object(3, 5, MarchingBaddie(), -1)
-    world.add_object(4, 4, MarchingBaddie(), -1)
-
-    return world
-
-def make_help_world5(width, height):
-    world = World(width, height)
-    world.place_turret_cooldown = 0
-    world.place_turret_points = 0
-    world.realtime = True
-    world.game_ui = False
-    world.num_waves = 1
-    world.help_text_on_top = True
-
-    world.help_text = """
-Firing at an enemy will deplete
-1 health from the turret.
-
-If a turret is attacked, it will
-lose 4 health.
-
-Placing a turret directly on
-another object will kill it."""
-
-    link = Link()
-    link.text = "Title"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_title_world
-    world.add_object(0, 7, link)
-
-    link = Link()
-    link.text = "Prev"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world4
-    world.add_object(1, 7, link)
-
-    link = Link()
-    link.text = "Page\n5 of 5"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world5
-    world.add_object(2, 7, link)
-
-    link = Link()
-    link.text = "" # Next
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world5
-    world.add_object(3, 7, link)
-
-    link = Link()
-    link.text = ""
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world5
-    world.add_object(4, 7, link)
-
-    link = Link()
-    link.text = "Reset"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world5
-    world.add_object(5, 7, link)
-
-    return world
-
-def make_title_world(width, height):
-    world = World(width, height)
-    world.num_waves = 0 # don't spawn enemies
-    world.click_to_baddie = True
-    world.game_ui = False
-
-    link = Link()
-    link.text = "Easy\nGame"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_easy_game
-    world.add_object(1, 3, link)
-
-    link = Link()
-    link.text = "Normal\nGame"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_normal_game
-    world.add_object(2, 4, link)
-
-    link = Link()
-    link.text = "Hard\nGame"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_hard_game
-    world.add_object(3, 3, link)
-
-    link = Link()
-    link.text = "Insane\nGame"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_insane_game
-    world.add_object(4, 4, link)
-
-    x = 0
-    for char in "Chary":
-        link = Link()
-        link.text = char
-        link.size = 1.0
-        link.action = ACTION_NEWWORLD
-        link.action_args = make_title_world
-        world.add_object(x, 1, link)
-        x += 1
-
-    link = Link()
-    link.text = "Help"
-    link.size = 0.35
-    link.action = ACTION_NEWWORLD
-    link.action_args = make_help_world1
-    world.add_object(1, 6, link)
-
-    link = Link()
-    link.text = "Quit"
-    link.size = 0.35
-    link.action = ACTION_QUIT
-    world.add_object(3, 6, link)
-
-    return world
-
-def run(x, y, w, h, game_width, game_height):
+def waits_for_player(world):
+    return (world.place_turret_cooldown <= world.place_turret_points and not world.click_to_baddie and
+            not world.lost and not world.realtime)
+
+def run(x, y, w, h, game_width, game_height, profiler=None, tracer=None, publisher=None, governor=None):
     screen = pygame.display.get_surface()
     paused = False
     frame = 0
+    speed_index = 0
+    # fraction of a tick owed at turbo speeds
+    tick_credit = 0.0
+    if tracer is None:
+        tracer = NullTracer()
+    if governor is None:
+        governor = QualityGovernor(RENDER_BUDGET)
     pygame.time.set_timer(pygame.USEREVENT, 15)
     timer_activated = True
     waiting_for_player = False
+    heatmap = None
+    heatmap_world = None
+    predictor = None
+    temporary_old_world = None
+    temporary_new_world = None
+    # the profiler needs the simulation on this thread; the title and help
+    # screens repeat the same few positions, which the cache skips
+    speculator = NextTickSpeculator(enabled=profiler is None, cache=TranspositionCache(TITLE_CACHE_SIZE))
 
     world = make_title_world(game_width, game_height)
-    old_world, world = world, world.advance()
+    old_world, world = world, speculator.advance(world)
+    speculator.start(world)
 
     while True:
         events = pygame.event.get()
@@ -1147,80 +677,187 @@ def run(x, y, w, h, game_width, game_height):
             if event.type == QUIT:
                 return
             elif event.type == KEYDOWN:
+                trace = tracer.begin('key')
                 if event.key == K_ESCAPE:
                     return
                 elif event.key == K_PAUSE or event.key == K_p:
                     paused = not paused
+                elif event.key == K_h:
+                    if heatmap is None:
+                        heatmap = PlacementHeatmap(lock=speculator.advance_lock)
+                        heatmap_world = None
+                    else:
+                        heatmap.close()
+                        heatmap = None
+                elif event.key == K_f:
+                    speed_index = (speed_index + 1) % len(TURBO_SPEEDS)
+                    tick_credit = 0.0
+                elif event.key == K_t:
+                    if predictor is None:
+                        predictor = TrajectoryPredictor(lock=speculator.advance_lock)
+                    else:
+                        predictor = None
             elif event.type == MOUSEBUTTONDOWN:
-                press_x = event.pos[0] * world.width / w + x
-                press_y = event.pos[1] * world.height / h + y
+                trace = tracer.begin('click')
+                press_x = event.pos[0] * world.width // w + x
+                press_y = event.pos[1] * world.height // h + y
+                trace.stage('converted')
                 if 0 <= press_x < world.width and 0 <= press_y < world.height:
                     world.hover(press_x, press_y)
+                    temporary_new_world = None
                     if event.button == 1:
                         if paused:
                             paused = not paused
                         else:
                             res = world.clicked(press_x, press_y)
+                            trace.stage('clicked')
                             if isinstance(res, Link):
+                                trace.kind = 'link click'
                                 if res.action == ACTION_NEWWORLD:
                                     world = res.action_args(game_width, game_height)
-                                    old_world, world = world, world.advance()
+                                    trace.stage('world made')
+                                    old_world, world = world, speculator.advance(world)
+                                    trace.stage('advanced')
+                                    speculator.start(world)
                                     waiting_for_player = False
                                 elif res.action == ACTION_QUIT:
                                     return
                             elif res:
+                                trace.kind = 'placement'
                                 waiting_for_player = False
+                                heatmap_world = None
+                                if predictor is not None:
+                                    if world.click_to_baddie:
+                                        predictor.invalidate()
+                                    else:
+                                        predictor.placed(world, press_x, press_y)
+                                # the click changed the world, so the
+                                # speculative next tick is stale
+                                speculator.start(world)
+                                trace.stage('speculation restarted')
                     elif event.button == 3:
                         if old_world.game_ui:
                             if old_world.lost or paused:
                                 world = make_title_world(game_width, game_height)
-                                old_world, world = world, world.advance()
+                                old_world, world = world, speculator.advance(world)
+                                speculator.start(world)
                                 paused = False
                             else:
                                 paused = not paused
             elif paused:
                 continue
             elif event.type == pygame.MOUSEMOTION:
-                press_x = event.pos[0] * world.width / w + x
-                press_y = event.pos[1] * world.height / h + y
+                press_x = event.pos[0] * world.width // w + x
+                press_y = event.pos[1] * world.height // h + y
                 if 0 <= press_x < world.width and 0 <= press_y < world.height:
                     world.hover(press_x, press_y)
             elif event.type == pygame.USEREVENT:
-                if world.place_turret_cooldown <= world.place_turret_points and not world.click_to_baddie and not world.lost and not world.realtime and frame % 20 == 19:
-                    waiting_for_player = True
+                speed = TURBO_SPEEDS[speed_index]
+                if speed == 1:
+                    if waits_for_player(world) and frame % 20 == 19:
+                        waiting_for_player = True
+                    else:
+                        frame += 1
+                        if frame % 20 == 0:
+                            if profiler is not None:
+                                profiler.tick()
+                            old_world, world = world, speculator.advance(world)
+                            speculator.start(world)
                 else:
-                    frame += 1
-                    if frame % 20 == 0:
-                        old_world, world = world, world.advance()
+                    # as many ticks as are owed, drawn without the ones in
+                    # between; events are still handled every frame
+                    if speed:
+                        # ticks that didn't fit in the budget carry over,
+                        # but not forever
+                        tick_credit = min(tick_credit + speed / 20.0, max(2.0, speed / 10.0))
+                    deadline = time.time() + TURBO_FRAME_BUDGET
+                    ticked = False
+                    while (not speed or tick_credit >= 1.0) and time.time() < deadline:
+                        if waits_for_player(world):
+                            waiting_for_player = True
+                            tick_credit = 0.0
+                            break
+                        if profiler is not None:
+                            profiler.tick()
+                        old_world, world = world, speculator.advance(world)
+                        tick_credit -= 1.0
+                        ticked = True
+                    if not speed:
+                        tick_credit = 0.0
+                    if ticked:
+                        speculator.start(world)
+                    # back at normal speed, the next frame ticks
+                    frame = 19
+
+        heatmap_values = None
+        if heatmap is not None:
+            if heatmap_world is not world:
+                heatmap.update(world)
+                heatmap_world = world
+            heatmap_values = heatmap.poll()
+
+        if predictor is not None:
+            predictor.update(world)
+
+        if publisher is not None:
+            publisher.publish(world)
+
+        tracer.stage_all('overlays updated')
+
+        governor.started()
 
         if waiting_for_player:
-            temporary_new_world = world.advance(shoot=False)
-            draw_world(world, temporary_new_world, 0.0, screen, x, y, w, h, True)
+            # only recomputed when the world changes, so the static layers
+            # stay cached while the player decides
+            if temporary_new_world is None or temporary_old_world is not world:
+                temporary_old_world = world
+                temporary_new_world = speculator.advance(world, shoot=False)
+                tracer.stage_all('preview advanced')
+            temporary_new_world.mouse_pos = world.mouse_pos
+            draw_world(world, temporary_new_world, 0.0, screen, x, y, w, h, True, heatmap_values, predictor, governor.level)
         else:
-            draw_world(old_world, world, (frame % 20) / 20.0, screen, x, y, w, h)
+            speed = TURBO_SPEEDS[speed_index]
+            if speed == 1:
+                t = (frame % 20) / 20.0
+            elif speed and speed < 20:
+                t = min(tick_credit, 1.0)
+            else:
+                t = 1.0
+            draw_world(old_world, world, t, screen, x, y, w, h, heatmap=heatmap_values, predictor=predictor, quality=governor.level)
+
+        tracer.stage_all('drawn')
 
         screen.fill(Color(0,0,32,255), Rect(0, h, w, 48))
 
         if world.game_ui:
-            font = pygame.font.Font(None, 48)
+            font = get_font(48)
             text = font.render(str(old_world.score), 1, Color(240, 240, 240, 255))
             screen.blit(text, (0, h))
 
+            if TURBO_SPEEDS[speed_index] != 1:
+                if TURBO_SPEEDS[speed_index]:
+                    text = get_text_sprite("x%s" % TURBO_SPEEDS[speed_index], 48, Color(240, 240, 240, 255))
+                else:
+                    text = get_text_sprite("max", 48, Color(240, 240, 240, 255))
+                screen.blit(text, text.get_rect(right=w, top=h))
+
         if world.game_ui and pygame.font:
             if paused:
-                text = font.render("Paused", 1, Color(240, 240, 240, 255))
+                text = get_text_sprite("Paused", 48, Color(240, 240, 240, 255))
                 textpos = text.get_rect(centerx=x+w//2, centery=y+h//2)
                 screen.blit(text, textpos)
             elif old_world.lost:
-                text = font.render("Game Over", 1, Color(240, 240, 240, 255))
+                text = get_text_sprite("Game Over", 48, Color(240, 240, 240, 255))
                 textpos = text.get_rect(centerx=x+w//2, centery=y+h//2)
                 screen.blit(text, textpos)
             if paused or old_world.lost:
-                text = font.render("Right-click to end", 1, Color(240, 240, 240, 255))
+                text = get_text_sprite("Right-click to end", 48, Color(240, 240, 240, 255))
                 textpos = text.get_rect(centerx=x+w//2, y=textpos.y + textpos.height)
                 screen.blit(text, textpos)
 
         pygame.display.flip()
+        tracer.flipped()
+        governor.finished()
 
         if timer_activated != bool(not paused and not waiting_for_player):
             timer_activated = not timer_activated
@@ -1230,6 +867,45 @@ def run(x, y, w, h, game_width, game_height):
                 pygame.time.set_timer(pygame.USEREVENT, 0)
 
 def main():
+    parser = argparse.ArgumentParser(description="Chary, the tower defense game.")
+    parser.add_argument("--profile-allocations", action="store_true",
+                        help="report memory allocated by each simulation and render phase")
+    parser.add_argument("--trace-latency", action="store_true",
+                        help="report how long input takes to show on screen, by stage")
+    parser.add_argument("--snapshot-interval", type=int, default=1000,
+                        help="ticks between memory snapshots, when profiling allocations")
+    parser.add_argument("--quality", default="auto", choices=("auto",) + QUALITY_NAMES,
+                        help="drawing quality; auto lowers it when frames take too long")
+    parser.add_argument("--report-quality", action="store_true",
+                        help="report the drawing quality frames were drawn at")
+    parser.add_argument("--no-sprite-cache", action="store_true",
+                        help="draw every sprite at startup instead of loading the ones saved last time")
+    parser.add_argument("--broadcast", metavar="PATH",
+                        help="send the game's ticks to viewers started with broadcast.py view PATH")
+    args = parser.parse_args()
+
+    profiler = None
+    if args.profile_allocations:
+        from profiling import AllocationProfiler
+        # this module, whatever it's called, draws the frames
+        profiler = AllocationProfiler(args.snapshot_interval, renderer=sys.modules[__name__])
+
+    tracer = None
+    if args.trace_latency:
+        tracer = LatencyTracer()
+
+    if args.quality == "auto":
+        governor = QualityGovernor(RENDER_BUDGET)
+    else:
+        governor = QualityGovernor(RENDER_BUDGET, QUALITY_NAMES.index(args.quality), adaptive=False)
+
+    publisher = None
+    if args.broadcast:
+        from broadcast import TickPublisher
+        publisher = TickPublisher(args.broadcast)
+
+    random.seed()
+
     game_width = 6
     game_height = 8
     width = game_width * 64
@@ -1238,8 +914,34 @@ def main():
     pygame.init()
 
     pygame.display.set_mode((width, height + 48))
-    
-    run(0, 0, width, height, game_width, game_height)
+
+    assets = None
+    if not args.no_sprite_cache:
+        from assetcache import AssetCache, get_cache_path
+        assets = AssetCache(get_cache_path(width // game_width, height // game_height), sprite_cache,
+                            [os.path.abspath(__file__)])
+        assets.load()
+
+    if profiler is not None:
+        profiler.start()
+
+    try:
+        run(0, 0, width, height, game_width, game_height, profiler, tracer, publisher, governor)
+    finally:
+        if assets is not None:
+            try:
+                assets.save()
+            except (IOError, OSError) as e:
+                sys.stderr.write("couldn't save sprites to %s: %s\n" % (assets.path, e))
+        if args.report_quality:
+            governor.report()
+        if publisher is not None:
+            publisher.close()
+        if tracer is not None:
+            tracer.report()
+        if profiler is not None:
+            profiler.stop()
+            profiler.report()
 
 if __name__ == '__main__':
     main()